@@ -0,0 +1,228 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import itertools
+import statistics
+import subprocess
+from collections.abc import Callable
+from typing import Any
+
+from c_arithmetic import OpTreeC
+
+# options varied per equation type, the other options are left at their defaults
+GRID: dict[str, tuple[str, ...]] = {
+    "complex arithmetic": ("difficulty",),
+    "general eq": ("difficulty",),
+    "system of eq": ("difficulty", "var_count"),
+    "second deg polynomials": ("difficulty", "degree"),
+    "polynomial div": ("difficulty", "degree"),
+    "inverse trig": ("difficulty",),
+}
+
+# how much slower a result may be before compare reports it as a regression
+THRESHOLD = 1.25
+
+# imports of the headless entry point, and how long they may take in milliseconds
+STARTUP_CODE = "import main, cli, start_menu"
+STARTUP_BUDGET = 30
+# modules that must only be imported once they're used
+STARTUP_FORBIDDEN = ("tkinter", "numpy", "sqlite3", "multiprocessing", "c_arithmetic", "eq_system", "poly_eq", "inv_trig")
+
+
+def time_calls(f: Callable[[], object], n: int, max_seconds: float = float("inf")) -> list[float]:
+    '''call `f` n times, or until `max_seconds` have passed, and return the duration of every call in seconds'''
+    times = []
+    deadline = time.perf_counter() + max_seconds
+    for _ in range(n):
+        start = time.perf_counter()
+        f()
+        end = time.perf_counter()
+        times.append(end - start)
+        if end > deadline:
+            break
+    return times
+
+
+def percentile(times: list[float], p: float) -> float:
+    '''nearest-rank percentile of sorted `times`'''
+    return times[min(len(times) - 1, max(0, round(p / 100 * len(times)) - 1))]
+
+
+def summarize(times: list[float]) -> dict[str, float]:
+    '''throughput and latency percentiles of a list of durations'''
+    times = sorted(times)
+    return {
+        "n": len(times),
+        "throughput": len(times) / sum(times) if sum(times) else float("inf"),
+        "mean": statistics.mean(times),
+        "p50": percentile(times, 50),
+        "p95": percentile(times, 95),
+        "p99": percentile(times, 99),
+        "max": times[-1],
+    }
+
+
+def grid(eq_type: str, difficulties: range, degrees: range, var_counts: range) -> list[dict[str, int]]:
+    '''every combination of the options varied for `eq_type`'''
+    values = {"difficulty": difficulties, "degree": degrees, "var_count": var_counts}
+    names = GRID[eq_type]
+    return [dict(zip(names, combo)) for combo in itertools.product(*(values[name] for name in names))]
+
+
+def run(args: argparse.Namespace) -> dict[str, Any]:
+    '''time every selected generator over the grid of options'''
+    from main import EQ_TYPES, OPTIONS
+
+    results = []
+    for eq_type in args.types or EQ_TYPES:
+        for varied in grid(eq_type, args.difficulty, args.degree, args.var_count):
+            options = OPTIONS | varied
+            rng = random.Random(args.seed)  # same questions every run
+            f = EQ_TYPES[eq_type]
+            time_calls(lambda: f(**options, rng=rng), args.warmup)
+            stats = summarize(time_calls(lambda: f(**options, rng=rng), args.n, args.max_seconds))
+            results.append({"type": eq_type, "options": varied} | stats)
+            print(
+                f"{eq_type:>24} {json.dumps(varied):>36} {stats['throughput']:>10.1f}/s "
+                f"p50 {stats['p50']*1e3:>9.3f} ms  p95 {stats['p95']*1e3:>9.3f} ms  p99 {stats['p99']*1e3:>9.3f} ms",
+                file=sys.stderr
+            )
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "seed": args.seed,
+        "results": results,
+    }
+
+
+def compare(old: dict[str, Any], new: dict[str, Any], threshold: float) -> list[str]:
+    '''describe every result that got more than `threshold` times slower'''
+    key = lambda r: (r["type"], json.dumps(r["options"], sort_keys=True))
+    before = {key(r): r for r in old["results"]}
+    regressions = []
+    for r in new["results"]:
+        b = before.get(key(r))
+        if b is None:
+            continue
+        for metric in ("p50", "p95", "p99"):
+            if r[metric] > b[metric] * threshold:
+                regressions.append(
+                    f"{r['type']} {json.dumps(r['options'])}: {metric} "
+                    f"{b[metric]*1e3:.3f} ms -> {r[metric]*1e3:.3f} ms ({r[metric] / b[metric]:.2f}x)"
+                )
+        if r["throughput"] * threshold < b["throughput"]:
+            regressions.append(
+                f"{r['type']} {json.dumps(r['options'])}: throughput "
+                f"{b['throughput']:.1f}/s -> {r['throughput']:.1f}/s ({b['throughput'] / r['throughput']:.2f}x slower)"
+            )
+    return regressions
+
+
+def import_times(code: str) -> dict[str, int]:
+    '''cumulative import time in microseconds of every module imported by running `code`, from -X importtime'''
+    env = os.environ | {"PYTHONPATH": os.path.dirname(os.path.abspath(__file__))}
+    err = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], env=env, capture_output=True, text=True, check=True
+    ).stderr
+    # the interpreter's own startup is imported before the code runs and isn't counted
+    err = err[err.rfind("| site\n") + 1:] if "| site\n" in err else err
+    times = {}
+    for m in re.finditer(r"^import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)$", err, re.MULTILINE):
+        times[m[3]] = int(m[1]) if not m[2] else times.get(m[3], 0)
+    return times
+
+
+def check_startup(code: str = STARTUP_CODE, budget: float = STARTUP_BUDGET, runs: int = 5) -> list[str]:
+    '''describe every way importing `code` breaks the startup budget, best of `runs` to ignore noise'''
+    best, modules = float("inf"), set()
+    for _ in range(runs):
+        times = import_times(code)
+        modules |= times.keys()
+        # nested imports are counted in the cumulative time of the top level import
+        best = min(best, sum(times[m] for m in times if m in code.replace(",", " ").split()) / 1e3)
+    problems = [f"{m} is imported at startup" for m in STARTUP_FORBIDDEN if m in modules]
+    if best > budget:
+        problems.append(f"startup takes {best:.1f} ms, the budget is {budget} ms")
+    print(f"{code!r}: {best:.1f} ms, budget {budget} ms", file=sys.stderr)
+    return problems
+
+
+def compare_complex(difficulties: range, n: int) -> None:
+    '''print timings of rejection sampling against constructive generation of complex expressions'''
+    print(f"{'difficulty':>10} {'method':>12} {'mean ms':>10} {'p95 ms':>10} {'max ms':>10}")
+    for difficulty in difficulties:
+        for method, f in (("rejection", OpTreeC), ("constructive", OpTreeC.constructive)):
+            rng = random.Random(difficulty)
+            stats = summarize(time_calls(lambda: f(difficulty, rng=rng), n))
+            print(
+                f"{difficulty:>10} {method:>12} {stats['mean']*1e3:>10.2f} "
+                f"{stats['p95']*1e3:>10.2f} {stats['max']*1e3:>10.2f}"
+            )
+
+
+def int_range(s: str) -> range:
+    '''parse "a-b" or "a" as an inclusive range'''
+    a, _, b = s.partition("-")
+    return range(int(a), int(b or a) + 1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="benchmark question generation")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("run", help="time every generator over a grid of options")
+    p.add_argument("-o", "--output", help="save results as json to this file")
+    p.add_argument("-t", "--types", nargs="+", choices=tuple(GRID), metavar="TYPE", help="equation types to time")
+    p.add_argument("--difficulty", type=int_range, default=range(1, 6), help="e.g. 1-5")
+    p.add_argument("--degree", type=int_range, default=range(2, 5), help="e.g. 2-4")
+    p.add_argument("--var-count", type=int_range, default=range(1, 4), help="e.g. 1-3")
+    p.add_argument("-n", type=int, default=100, help="questions per combination of options")
+    p.add_argument("--warmup", type=int, default=5, help="untimed questions per combination of options")
+    p.add_argument("--max-seconds", type=float, default=10, help="time limit per combination of options")
+    p.add_argument("--seed", type=int, default=0)
+
+    p = sub.add_parser("compare", help="report regressions between two saved runs")
+    p.add_argument("old")
+    p.add_argument("new")
+    p.add_argument("--threshold", type=float, default=THRESHOLD, help="allowed slowdown factor")
+
+    p = sub.add_parser("startup", help="check the headless entry point imports quickly and lazily")
+    p.add_argument("--budget", type=float, default=STARTUP_BUDGET, help="milliseconds")
+    p.add_argument("--code", default=STARTUP_CODE, help="imports to time")
+
+    p = sub.add_parser("complex", help="compare rejection and constructive complex arithmetic")
+    p.add_argument("--difficulty", type=int_range, default=range(1, 9), help="e.g. 1-8")
+    p.add_argument("-n", type=int, default=50, help="questions per difficulty")
+
+    args = parser.parse_args()
+    match args.command:
+        case "run":
+            results = run(args)
+            if args.output:
+                with open(args.output, "w") as f:
+                    json.dump(results, f, indent=1)
+        case "compare":
+            with open(args.old) as f:
+                old = json.load(f)
+            with open(args.new) as f:
+                new = json.load(f)
+            regressions = compare(old, new, args.threshold)
+            print("\n".join(regressions) or "no regressions")
+            sys.exit(1 if regressions else 0)
+        case "startup":
+            problems = check_startup(args.code, args.budget)
+            print("\n".join(problems) or "startup within budget")
+            sys.exit(1 if problems else 0)
+        case "complex":
+            compare_complex(args.difficulty, args.n)
+
+
+if __name__ == "__main__":
+    main()
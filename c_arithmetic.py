@@ -1,8 +1,16 @@
 import re
+import math
 import random
-from typing import TypeVar
+import itertools
+import functools
+from dataclasses import dataclass
+from typing import Self, TypeVar
 from collections.abc import Iterable
 
+import stats
+from dedup import fingerprint
+from question import Question
+
 T = TypeVar("T")
 
 #             ( -?      a )             ( a+bi  |   a-bi | b=0 | a=0 )  ( -?      b       i )
@@ -10,10 +18,25 @@ T = TypeVar("T")
 COMPLEX_RE = "^(-?\\s*[0-9]+)?\\s*((?<!^)\\+(?!$)|(?=-)|(?<=^)|(?=$))\\s*(-?\\s*[0-9]*\\s*i)?$"
 
 
-def weighted_random(seq: Iterable[tuple[T, int]]) -> T:
+@dataclass(frozen=True)
+class ConfigC:
+    '''settings for generating complex expressions'''
+
+    # valid operations and their random weight
+    opers: tuple[tuple[str, int], ...] = (
+        ("add", 10), ("sub", 5), ("mul", 10), ("div", 2), ("conj", 1), ("abs", 1), ("re", 1), ("im", 1)
+    )
+    const_range: tuple[int, int] = (-5, 10)  # range of parts in constants
+    val_range: tuple[int, int] = (-50, 100)  # range of values of expression
+
+
+DEFAULT_CONFIG = ConfigC()
+
+
+def weighted_random(seq: Iterable[tuple[T, int]], rng: random.Random) -> T:
     '''return a random item from the first element in the tuples in seq weighted by the second element in the tuples'''
     i = sum(w for _, w in seq)
-    i = random.randrange(0, i)
+    i = rng.randrange(0, i)
     for t, w in seq:
         i -= w
         if i < 0:
@@ -59,68 +82,220 @@ def parse_complex(z: str) -> complex:
         raise ValueError("please answer in the form 'a+bi'")
 
 
+def random_part(lo: int, hi: int, rng: random.Random) -> int | None:
+    '''random integer in [lo, hi] or None if the range is empty'''
+    return rng.randint(lo, hi) if lo <= hi else None
+
+
+def reach(depth: int, config: ConfigC) -> tuple[int, int]:
+    '''range of parts every value of which some expression at most `depth` operations deep can have'''
+    lo, hi = config.const_range
+    for _ in range(depth):
+        # any value in twice the range of the operands can be written as a sum
+        lo, hi = max(2 * lo, config.val_range[0]), min(2 * hi, config.val_range[1])
+    return lo, hi
+
+
+@functools.cache
+def nonzero_constants(lo: int, hi: int) -> dict[int, tuple[tuple[int, int], ...]]:
+    '''nonzero gaussian integers with parts in [lo, hi] grouped by norm, in increasing norm'''
+    by_norm: dict[int, list[tuple[int, int]]] = {}
+    for x, y in itertools.product(range(lo, hi + 1), repeat=2):
+        if x or y:
+            by_norm.setdefault(x*x + y*y, []).append((x, y))
+    return {n: tuple(by_norm[n]) for n in sorted(by_norm)}
+
+
+def gaussian_div(a: int, b: int, c: int, d: int) -> tuple[int, int] | None:
+    '''(a + bi) / (c + di) if it is a gaussian integer, else None'''
+    n = c * c + d * d
+    re, im = a * c + b * d, b * c - a * d
+    if re % n or im % n:
+        return None
+    return re // n, im // n
+
+
+def operands(
+    op: str, a: int, b: int, lo: int, hi: int, rng: random.Random, config: ConfigC
+) -> tuple[tuple[int, int], ...] | None:
+    '''random operands with parts in [lo, hi] such that `op` applied to them gives a + bi, None if impossible'''
+    c_lo, c_hi = config.const_range
+    match op:
+        case "add":  # a + bi = L + R
+            x = random_part(max(lo, a - hi), min(hi, a - lo), rng)
+            y = random_part(max(lo, b - hi), min(hi, b - lo), rng)
+            if x is not None and y is not None:
+                return (x, y), (a - x, b - y)
+        case "sub":  # a + bi = L - R
+            x = random_part(max(lo, lo - a), min(hi, hi - a), rng)
+            y = random_part(max(lo, lo - b), min(hi, hi - b), rng)
+            if x is not None and y is not None:
+                return (a + x, b + y), (x, y)
+        case "mul":  # a + bi = L * R, one factor a small constant
+            if a == 0 and b == 0:
+                f, q = (0, 0), (rng.randint(lo, hi), rng.randint(lo, hi))
+            else:
+                # the norm of a factor divides the norm of the product
+                norm = a*a + b*b
+                factors = [
+                    (f, q) for n, fs in nonzero_constants(c_lo, c_hi).items() if norm % n == 0 for f in fs
+                    if (q := gaussian_div(a, b, *f)) and lo <= min(q) and max(q) <= hi
+                ]
+                if not factors:
+                    return None
+                f, q = rng.choice(factors)
+            return (f, q) if rng.random() < 0.5 else (q, f)
+        case "div":  # a + bi = L / R, the divisor a small constant
+            # the norm of the dividend is bounded by the range
+            limit = 2 * max(lo*lo, hi*hi)
+            norm = a*a + b*b
+            dividends = [
+                ((a*x - b*y, a*y + b*x), (x, y))
+                for n, fs in itertools.takewhile(lambda i: i[0] * norm <= limit, nonzero_constants(c_lo, c_hi).items())
+                for x, y in fs if lo <= min(a*x - b*y, a*y + b*x) and max(a*x - b*y, a*y + b*x) <= hi
+            ]
+            if dividends:
+                return rng.choice(dividends)
+        case "conj":  # a + bi = conj(L)
+            if lo <= a <= hi and lo <= -b <= hi:
+                return (a, -b),
+        case "abs":  # a = |L|
+            if b == 0 and a >= 0:
+                parts = []
+                for x in range(max(lo, -a), min(hi, a) + 1):
+                    y = math.isqrt(a*a - x*x)
+                    if y * y == a*a - x*x:
+                        parts += [(x, y) for y in {y, -y} if lo <= y <= hi]
+                if parts:
+                    return rng.choice(parts),
+        case "re":  # a = Re(L)
+            if b == 0 and lo <= a <= hi:
+                return (a, rng.randint(lo, hi)),
+        case "im":  # a = Im(L)
+            if b == 0 and lo <= a <= hi:
+                return (rng.randint(lo, hi), a),
+    return None
+
+
 class OpTreeC:
     '''represents a complex expression'''
 
-    # valid operations and their random weight
-    opers = {"add": 10, "sub": 5, "mul": 10, "div": 2, "conj": 1, "abs": 1, "re": 1, "im": 1}
-    const_range = (-5, 10)  # range of parts in constants
-    val_range = (-50, 100)  # range of values of expression
-
-    def __init__(self, depth: int):
+    def __init__(self, depth: int, rng: random.Random | None = None, config: ConfigC = DEFAULT_CONFIG):
         '''construct a random expression at most `depth` operations deep'''
+        rng = rng or random.Random()
         # chance to be leaf node
-        self.op: str = "const" if random.random() < 2 ** -depth else weighted_random(OpTreeC.opers.items())
-        self.val: complex | None = None
+        self.op: str = "const" if rng.random() < 2 ** -depth else weighted_random(config.opers, rng)
+        self.val: complex | None = None  # value of the expression, cached once valid
         self.left: OpTreeC | None = None
         self.right: OpTreeC | None = None
+        self.retries = 0  # rejected attempts while building this subtree, including discarded subtrees
+        self.evals = 0  # node evaluations while building this subtree, including discarded subtrees
 
         while True:
             match self.op:
                 case "const":  # constant
-                    self.val = random.randint(*OpTreeC.const_range) + 1j * random.randint(*OpTreeC.const_range)
+                    self.val = rng.randint(*config.const_range) + 1j * rng.randint(*config.const_range)
                 case "add" | "sub" | "mul" | "div":  # binary operators
-                    self.left = OpTreeC(depth-1)
-                    self.right = OpTreeC(depth-1)
+                    self.left = OpTreeC(depth-1, rng, config)
+                    self.right = OpTreeC(depth-1, rng, config)
+                    self.retries += self.left.retries + self.right.retries
+                    self.evals += self.left.evals + self.right.evals
                 case _:  # unary operators
-                    self.left = OpTreeC(depth-1)
+                    self.left = OpTreeC(depth-1, rng, config)
+                    self.retries += self.left.retries
+                    self.evals += self.left.evals
 
+            self.evals += 1
             try:
                 # make sure no division by zero occurs
-                z = self()
+                z = self.evaluate()
             except ZeroDivisionError:
+                self.retries += 1
+                stats.count("rejected: division by zero")
                 continue
             else:
                 # make sure the parts are small integers
                 if (
                     z.real.is_integer() and z.imag.is_integer()
-                    and OpTreeC.val_range[0] <= z.real <= OpTreeC.val_range[1]
-                    and OpTreeC.val_range[0] <= z.imag <= OpTreeC.val_range[1]
+                    and config.val_range[0] <= z.real <= config.val_range[1]
+                    and config.val_range[0] <= z.imag <= config.val_range[1]
                 ):
                     self.val = z
                     break
+                self.retries += 1
+                stats.count("rejected: not a small gaussian integer")
 
-    def __call__(self) -> complex:
-        '''evaluates the expression'''
+    @classmethod
+    def node(cls, op: str, left: Self | None = None, right: Self | None = None, val: complex | None = None) -> Self:
+        '''construct a node from given children, `val` is required for constants and otherwise evaluated'''
+        self = cls.__new__(cls)
+        self.op = op
+        self.left = left
+        self.right = right
+        self.val = val
+        self.retries = 0
+        self.evals = 0
+        stats.count("nodes")
+        if val is None:
+            self.val = self.evaluate()
+        return self
+
+    @classmethod
+    def constructive(
+        cls, depth: int, val: complex | None = None, rng: random.Random | None = None, config: ConfigC = DEFAULT_CONFIG
+    ) -> Self:
+        '''construct a random expression at most `depth` operations deep evaluating to `val`
+        \n works backwards from the value so no attempt is ever rejected
+        \n raises ValueError if `config.opers` can't pick addition, the operation that is always possible'''
+        if dict(config.opers).get("add", 0) <= 0:
+            raise ValueError("constructive expressions need \"add\" in config.opers with a positive weight")
+        rng = rng or random.Random()
+        lo, hi = reach(depth, config)
+        if val is None:
+            val = complex(rng.randint(lo, hi), rng.randint(lo, hi))
+        a, b = int(val.real), int(val.imag)
+        c_lo, c_hi = config.const_range
+
+        # chance to be leaf node, only possible if the value is a valid constant
+        if depth <= 0 or (rng.random() < 2 ** -depth and c_lo <= a <= c_hi and c_lo <= b <= c_hi):
+            return cls.node("const", val=complex(a, b))
+
+        # same weights as the random construction, restricted to operations that can give the value
+        opers = dict(config.opers)
+        lo, hi = reach(depth - 1, config)
+        while (z := operands(op := weighted_random(opers.items(), rng), a, b, lo, hi, rng, config)) is None:
+            del opers[op]  # addition is always possible so this ends
+
+        children = (cls.constructive(depth - 1, complex(*p), rng, config) for p in z)
+        return cls.node(op, *children, val=complex(a, b))
+
+    def evaluate(self) -> complex:
+        '''evaluates this node from the cached values of its children'''
         match self.op:
             case "const":
                 return self.val
             case "add":
-                return self.left() + self.right()
+                return self.left.val + self.right.val
             case "sub":
-                return self.left() - self.right()
+                return self.left.val - self.right.val
             case "mul":
-                return self.left() * self.right()
+                return self.left.val * self.right.val
             case "div":
-                return self.left() / self.right()
+                return self.left.val / self.right.val
             case "conj":
-                return self.left().conjugate()
+                return self.left.val.conjugate()
             case "abs":
-                return abs(self.left())
+                return abs(self.left.val)
             case "re":
-                return complex(self.left().real, 0)
+                return complex(self.left.val.real, 0)
             case "im":
-                return complex(self.left().imag, 0)
+                return complex(self.left.val.imag, 0)
+
+    def __call__(self) -> complex:
+        '''evaluates the expression'''
+        if self.val is None:
+            return self.evaluate()
+        return self.val
 
     def __str__(self) -> str:
         '''represent expression as a string'''
@@ -155,6 +330,18 @@ class OpTreeC:
         return s
 
 
-def get_complex(difficulty: int, **_):
-    c = OpTreeC(difficulty)
-    return f"Evaluate\n\t{c}\n= ", lambda x: parse_complex(x) == c.val
+@stats.measured("complex arithmetic")
+def get_complex(
+    difficulty: int, constructive: bool = False,
+    rng: random.Random | None = None, config: ConfigC = DEFAULT_CONFIG, **_
+):
+    rng = rng or random.Random()
+    c = OpTreeC.constructive(difficulty, rng=rng, config=config) if constructive else OpTreeC(difficulty, rng, config)
+    # counted once here, per node it would be too slow, `OpTreeC.node` counts the nodes of constructive trees itself
+    # every evaluation beyond a node's first is a retry, so the nodes created are the evaluations minus the retries
+    stats.count("nodes", c.evals - c.retries)
+    stats.count("evals", c.evals)
+    from flat_tree import FlatTree  # flat_tree imports this module
+    return Question(
+        f"Evaluate\n\t{c}\n= ", "complex", c.val, fingerprint("complex arithmetic", FlatTree.from_tree(c).canonical())
+    )
@@ -1,7 +1,15 @@
-from collections.abc import Callable
+import os
+import sys
+import json
+import random
+import argparse
+from collections import deque
+from typing import Any, TextIO
 
-# (question, grading function)
-type Question = tuple[str, Callable[[str], bool]]
+import tracing
+from question import Question
+
+CHUNK = 256  # questions generated per task sent to a worker process
 
 
 def give_question(q: Question, i: int) -> None:
@@ -12,7 +20,9 @@ def give_question(q: Question, i: int) -> None:
         try:
             print(f"Question #{i+1}\n")
             # call grading function of question with user inputted answer
-            correct = q[1](input(q[0]))
+            ans = input(q.text)
+            with tracing.span("grade", answer=ans):
+                correct = q.grade(ans)
         except ValueError as e:
             # grading function failed
             print(f"Error: {e}\n")
@@ -23,3 +33,86 @@ def give_question(q: Question, i: int) -> None:
                 break  # done with question
             else:
                 print("Incorrect, try again.\n")
+
+
+def export_chunk(
+    types: tuple[str, ...], options: dict[str, Any], start: int, count: int, seed: int | None
+) -> tuple[list[tuple[int, str]], Any, Any]:
+    '''fingerprints and json lines of `count` questions, numbered from `start`, run in a worker process
+    \n returned with the counters and trace events generating them produced, see `question_pool.merge_job`
+    \n with a seed every chunk is reproducible no matter which worker generates it'''
+    import stats
+    from main import EQ_TYPES
+
+    rng = random.Random(f"{seed}:{start}") if seed is not None else random.Random()
+    lines = []
+    for i in range(start, start + count):
+        eq_type = rng.choice(types)
+        q = EQ_TYPES[eq_type](**options, rng=rng)
+        lines.append((q.fingerprint, json.dumps({"id": i, "type": eq_type, "options": options} | q.to_json()) + "\n"))
+    return lines, stats.collect(), tracing.collect()
+
+
+def export(
+    out: TextIO, n: int, types: tuple[str, ...], options: dict[str, Any],
+    workers: int | None = None, seed: int | None = None, unique: bool = False
+) -> int:
+    '''write `n` questions as json lines in order, generated in a process pool, returns how many were written
+    \n at most two chunks per worker are in flight so memory doesn't grow with `n`
+    \n with `unique` questions equivalent to one already written are skipped, in memory bounded by a bloom filter
+    \n which rarely skips a new question as well, fewer than `n` are written if nearly every possible one has been'''
+    from concurrent.futures import ProcessPoolExecutor
+    from dedup import BloomFilter
+    from question_pool import init_worker, merge_job
+
+    workers = workers or os.cpu_count() or 1
+    seen = BloomFilter(max(n, 1)) if unique else None
+    written = 0
+    with ProcessPoolExecutor(workers, initializer=init_worker) as executor:
+        pending = deque()
+        start = 0
+        while written < n:
+            # without duplicates the first n questions are written, with them generate until n are unique
+            while len(pending) < 2 * workers and (unique or start < n):
+                count = CHUNK if unique else min(CHUNK, n - start)
+                pending.append(executor.submit(export_chunk, types, options, start, count, seed))
+                start += count
+            lines = [line for fp, line in merge_job(pending.popleft().result()) if seen is None or not seen.add(fp)]
+            if not lines:
+                break  # a whole chunk of repeats
+            lines = lines[:n - written]
+            out.write("".join(lines))
+            written += len(lines)
+        for f in pending:
+            f.cancel()
+    return written
+
+
+def main() -> None:
+    from main import EQ_TYPES, OPTIONS
+
+    parser = argparse.ArgumentParser(description="generate questions as json lines, e.g. for worksheets or the question bank")
+    parser.add_argument("n", type=int, help="number of questions")
+    parser.add_argument("-t", "--types", nargs="+", choices=tuple(EQ_TYPES), metavar="TYPE", help="default all types")
+    parser.add_argument("-o", "--output", help="file to write, default stdout")
+    parser.add_argument("--difficulty", type=int, default=OPTIONS["difficulty"])
+    parser.add_argument("--degree", type=int, default=OPTIONS["degree"])
+    parser.add_argument("--var-count", type=int, default=OPTIONS["var_count"])
+    parser.add_argument("--workers", type=int, help="generator processes, default the number of cpus")
+    parser.add_argument("--seed", type=int, help="same seed and arguments give the same questions")
+    parser.add_argument("--unique", action="store_true", help="skip questions equivalent to one already written")
+    args = parser.parse_args()
+
+    options = {"difficulty": args.difficulty, "degree": args.degree, "var_count": args.var_count}
+    types = tuple(args.types or EQ_TYPES)
+    if args.output:
+        with open(args.output, "w") as out:
+            written = export(out, args.n, types, options, args.workers, args.seed, args.unique)
+    else:
+        written = export(sys.stdout, args.n, types, options, args.workers, args.seed, args.unique)
+    if written < args.n:
+        print(f"only {written} distinct questions found", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import math
+import hashlib
+from typing import Any
+
+
+def fingerprint(name: str, canonical: Any) -> int:
+    '''stable 64 bit hash of a question's canonical form, unlike `hash` the same in every process and run
+    \n `canonical` is built from tuples, strings and numbers, `name` tells apart question types with the same form'''
+    return int.from_bytes(hashlib.blake2b(repr((name, canonical)).encode(), digest_size=8).digest(), "little")
+
+
+class BloomFilter:
+    '''set of fingerprints in fixed memory, may wrongly claim to contain one it doesn't
+    \n sized so that after `capacity` fingerprints that happens with probability `error`'''
+
+    def __init__(self, capacity: int = 10_000_000, error: float = 0.001):
+        if capacity < 1 or not 0 < error < 1:
+            raise ValueError("capacity must be positive and error between 0 and 1")
+        self.size = max(8, math.ceil(-capacity * math.log(error) / math.log(2) ** 2))  # bits
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0  # fingerprints added that weren't contained yet
+
+    def __contains__(self, fp: int) -> bool:
+        bits, size = self.bits, self.size
+        h, step = fp & 0xFFFFFFFF, fp >> 32 | 1  # bits for a fingerprint from its two halves by double hashing
+        for _ in range(self.hashes):
+            p = h % size
+            if not bits[p >> 3] & 1 << (p & 7):
+                return False
+            h += step
+        return True
+
+    def add(self, fp: int) -> bool:
+        '''add a fingerprint, returns wether it was contained already'''
+        bits, size = self.bits, self.size
+        h, step = fp & 0xFFFFFFFF, fp >> 32 | 1  # same bits as `__contains__`
+        seen = True
+        for _ in range(self.hashes):
+            p = h % size
+            mask = 1 << (p & 7)
+            if not bits[p >> 3] & mask:
+                bits[p >> 3] |= mask
+                seen = False
+            h += step
+        self.count += not seen
+        return seen
+
+    def __len__(self) -> int:
+        return self.count
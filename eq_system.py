@@ -1,23 +1,46 @@
+import math
 import random
+import weakref
+import threading
+from dataclasses import dataclass
 from typing import Self, TypeVar, Any
 from collections.abc import Iterable, Generator
 
+import stats
+from dedup import fingerprint
+from question import Question, EquationsSpec
+
 T = TypeVar("T")
 
+# expression to be built, nested (op, left, right) tuples of existing expressions
+type Rewrite = OpTreeExpr | tuple[str, Rewrite, Rewrite]
+
+
+@dataclass(frozen=True)
+class ConfigEq:
+    '''settings for generating equations'''
+
+    opers: tuple[tuple[str, int], ...] = (("add", 10), ("sub", 5), ("mul", 10), ("div", 2))  # operations and weights
+    const_range: tuple[int, int] = (-5, 10)  # range of parts in constants
+    root_range: tuple[int, int] = (-5, 10)  # range of roots
+
+
+DEFAULT_CONFIG = ConfigEq()
 
-def weighted_random(seq: Iterable[tuple[T, int]]) -> T:
+
+def weighted_random(seq: Iterable[tuple[T, int]], rng: random.Random) -> T:
     '''return a random item from the first element in the tuples in seq weighted by the second element in the tuples'''
     i = sum(w for _, w in seq)
-    i = random.randrange(0, i)
+    i = rng.randrange(0, i)
     for t, w in seq:
         i -= w
         if i < 0:
             return t
 
 
-def random_roots(n: int, rand_range: tuple[int, int]) -> tuple[int, ...]:
+def random_roots(n: int, rand_range: tuple[int, int], rng: random.Random) -> tuple[int, ...]:
     '''returns a tuple of `n` random numbers within the range `rand_range`'''
-    return tuple(random.randint(*rand_range) for _ in range(n))
+    return tuple(rng.randint(*rand_range) for _ in range(n))
 
 
 def tuple_replace(t: tuple[Any, ...], i: int, v: Any) -> tuple[Any, ...]:
@@ -43,100 +66,199 @@ def parse_tuple(x: str) -> tuple[float]:
         raise ValueError("please answer in the form 'a, b, c, ...'")
 
 
+# weak references to every expression by its key, see `OpTreeExpr.__new__`
+interned: dict[tuple[Any, ...], weakref.ref] = {}
+intern_lock = threading.Lock()
+intern_sweep_at = 4096  # size of `interned` at which references to dead expressions are removed
+
+
+def sweep_interned() -> None:
+    '''remove references to dead expressions from `interned`, cheaper than a callback per expression'''
+    global intern_sweep_at
+    for key in [key for key, ref in interned.items() if ref() is None]:
+        del interned[key]
+    intern_sweep_at = max(4096, 2 * len(interned))
+
+
 class OpTreeExpr:
-    '''represents a real expression'''
+    '''represents a real expression
+    \n nodes are immutable and interned, identical expressions are the same object'''
+
+    __slots__ = ("op", "index", "val", "left", "right", "hash", "rewrites", "__weakref__")
 
     var_str = "xyzabcduvw"  # characters to use as variable names
-    opers = {"add": 10, "sub": 5, "mul": 10, "div": 2}  # valid operations and their random weight
 
-    def __init__(self, op: str, *args: Any):
-        self.op = op
-        self.index: int | None = None
-        self.val: float | None = None
-        self.left: OpTreeExpr | None = None
-        self.right: OpTreeExpr | None = None
+    def __new__(cls, op: str, *args: Any):
+        match op:
+            case "var":  # variable
+                key = op, args[0]
+            case "const":  # constant, 1 and 1.0 as well as 0.0 and -0.0 are printed differently
+                key = op, type(args[0]), args[0], math.copysign(1, args[0])
+            case _:  # operator, the operands are interned already and kept alive by the node
+                key = op, id(args[0]), id(args[1])
+
+        ref = interned.get(key)
+        if ref is not None and (self := ref()) is not None:
+            return self
+
+        index = val = left = right = None
+        match op:
+            case "var":
+                index = args[0]
+                h = hash(key)
+            case "const":
+                val = args[0]
+                h = hash(key)
+            case _:
+                left, right = args
+                h = hash((op, left.hash, right.hash))
+
+        # slots are set through their descriptors since `__setattr__` is disabled
+        stats.count("nodes")
+        self = object.__new__(cls)
+        set_slots = OpTreeExpr.set_slots
+        set_slots[0](self, op)
+        set_slots[1](self, index)
+        set_slots[2](self, val)
+        set_slots[3](self, left)
+        set_slots[4](self, right)
+        set_slots[5](self, h)
+        set_slots[6](self, None)  # cached result of `transformation_count`
+
+        # if another thread interned an equal expression meanwhile use that one
+        with intern_lock:
+            ref = interned.get(key)
+            if ref is not None and (other := ref()) is not None:
+                return other
+            interned[key] = weakref.ref(self)
+            if len(interned) >= intern_sweep_at:
+                sweep_interned()
+        return self
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError("expressions are immutable")
+
+    def equals(self, other: "OpTreeExpr") -> bool:
+        '''wether the expressions are the same with constants compared by value, so 2 equals 2.0 unlike with `is`'''
+        if self is other:
+            return True
+        if self.op != other.op:
+            return False
+        match self.op:
+            case "var":
+                return self.index == other.index
+            case "const":
+                return self.val == other.val
+            case _:
+                return self.left.equals(other.left) and self.right.equals(other.right)
 
+    def __reduce__(self):
+        '''pickle through `__new__` so unpickled expressions are interned too'''
         match self.op:
-            case "var":  # variable
-                self.index = args[0]
-            case "const":  # constant
-                self.val = args[0]
-            case _:  # operator
-                self.left = args[0]
-                self.right = args[1]
+            case "var":
+                return OpTreeExpr, (self.op, self.index)
+            case "const":
+                return OpTreeExpr, (self.op, self.val)
+            case _:
+                return OpTreeExpr, (self.op, self.left, self.right)
 
-    def transformations(self) -> Generator[Self, None, None]:
-        '''yields slightly modified but equivalent expressions'''
+    def local_rewrites(self) -> list[Rewrite]:
+        '''slightly modified but equivalent expressions that differ at this node, not only in an operand
+        \n they are returned unbuilt as nested (op, left, right) tuples, see `build`'''
+        rewrites: list[Rewrite] = []
 
         if self.op in ("var", "const"):  # cannot be transformed
-            return
+            return rewrites
 
         # combine constants
         if self.left.op == "const" and self.right.op == "const":
             x: float = self(())
             if x.is_integer():
-                yield OpTreeExpr("const", x)
+                rewrites.append(OpTreeExpr("const", x))
 
         # commutative
         if self.op in ("add", "mul"):  # a +* b
-            yield OpTreeExpr(self.op, self.right, self.left)  # b +* a
+            rewrites.append((self.op, self.right, self.left))  # b +* a
 
         # associative
         if self.op in ("add", "mul") and self.op == self.left.op:  # (a +* b) +* c
-            yield OpTreeExpr(  # a +* (b +* c)
-                self.op,
-                self.left.left,
-                OpTreeExpr(self.op, self.left.right, self.right)
-            )
+            rewrites.append((self.op, self.left.left, (self.op, self.left.right, self.right)))  # a +* (b +* c)
         if self.op in ("add", "mul") and self.op == self.right.op:  # a +* (b +* c)
-            yield OpTreeExpr(  # (a +* b) +* c
-                self.op,
-                OpTreeExpr(self.op, self.left, self.right.left),
-                self.right.right
-            )
+            rewrites.append((self.op, (self.op, self.left, self.right.left), self.right.right))  # (a +* b) +* c
 
         # right distributive
         if self.op in ("mul", "div") and self.left.op in ("add", "sub"):  # (b +- c) */ a
-            yield OpTreeExpr(  # (b */ a) +- (c */ a)
+            rewrites.append((  # (b */ a) +- (c */ a)
                 self.left.op,
-                OpTreeExpr(self.op, self.left.left, self.right),
-                OpTreeExpr(self.op, self.left.right, self.right)
-            )
+                (self.op, self.left.left, self.right),
+                (self.op, self.left.right, self.right)
+            ))
 
         # left distributive
         if self.op == "mul" and self.right.op in ("add", "sub"):  # a * (b +- c)
-            yield OpTreeExpr(  # (a * b) +- (a * c)
+            rewrites.append((  # (a * b) +- (a * c)
                 self.right.op,
-                OpTreeExpr(self.op, self.left,  self.right.left),
-                OpTreeExpr(self.op, self.left, self.right.right)
-            )
+                (self.op, self.left, self.right.left),
+                (self.op, self.left, self.right.right)
+            ))
+
+        # sides as (op, left, right) so they can be compared to 1 * side without building it
+        left = self.left.op, self.left.left, self.left.right
+        right = self.right.op, self.right.left, self.right.right
 
         # right distributive
         if self.op in ("add", "sub"):
-            left = OpTreeExpr("mul", OpTreeExpr("const", 1), self.left)  # 1 * left
-            right = OpTreeExpr("mul", OpTreeExpr("const", 1), self.right)  # 1 * right
-            for l, r in ((self.left, self.right), (self.left, right), (left, self.right), (left, right)):
-                if l.op in ("mul", "div") and l.op == r.op and l.right == r.right:  # (b */ a) +- (c */ a)
-                    yield OpTreeExpr(  # (b +- c) */ a
-                        l.op,
-                        OpTreeExpr(self.op, l.left, r.left),
-                        r.right
-                    )
+            left_one = "mul", ONE, self.left  # 1 * left
+            right_one = "mul", ONE, self.right  # 1 * right
+            for l, r in ((left, right), (left, right_one), (left_one, right), (left_one, right_one)):
+                if l[0] in ("mul", "div") and l[0] == r[0] and l[2].equals(r[2]):  # (b */ a) +- (c */ a)
+                    rewrites.append((l[0], (self.op, l[1], r[1]), r[2]))  # (b +- c) */ a
 
         # left distributive
         if self.op in ("add", "sub"):
-            left = OpTreeExpr("mul", self.left, OpTreeExpr("const", 1))  # left * 1
-            right = OpTreeExpr("mul", self.right, OpTreeExpr("const", 1))  # right * 1
-            for l, r in ((self.left, self.right), (self.left, right), (left, self.right), (left, right)):
-                if l.op == "mul" and l.op == r.op and l.left == r.left:  # (a * b) +- (a * c)
-                    yield OpTreeExpr(  # a * (b +- c)
-                        l.op,
-                        l.left,
-                        OpTreeExpr(self.op, l.right, r.right)
-                    )
-
-        yield from (OpTreeExpr(self.op, l, self.right) for l in self.left.transformations())  # transform left
-        yield from (OpTreeExpr(self.op, self.left, r) for r in self.right.transformations())  # transform right
+            left_one = "mul", self.left, ONE  # left * 1
+            right_one = "mul", self.right, ONE  # right * 1
+            for l, r in ((left, right), (left, right_one), (left_one, right), (left_one, right_one)):
+                if l[0] == "mul" and l[0] == r[0] and l[1].equals(r[1]):  # (a * b) +- (a * c)
+                    rewrites.append((l[0], l[1], (self.op, l[2], r[2])))  # a * (b +- c)
+
+        return rewrites
+
+    def transformations(self) -> Generator[Self, None, None]:
+        '''yields slightly modified but equivalent expressions'''
+        yield from (build(r) for r in self.local_rewrites())
+
+        if self.op not in ("var", "const"):
+            yield from (OpTreeExpr(self.op, l, self.right) for l in self.left.transformations())  # transform left
+            yield from (OpTreeExpr(self.op, self.left, r) for r in self.right.transformations())  # transform right
+
+    def transformation_count(self) -> int:
+        '''number of expressions `transformations` yields, cached on the node'''
+        if self.rewrites is None:
+            n = len(self.local_rewrites())
+            if self.op not in ("var", "const"):
+                n += self.left.transformation_count() + self.right.transformation_count()
+            object.__setattr__(self, "rewrites", n)
+        return self.rewrites
+
+    def transformation(self, i: int) -> Self:
+        '''the expression `transformations` yields at index `i`, building only that one'''
+        local = self.local_rewrites()
+        if i < len(local):
+            return build(local[i])
+        i -= len(local)
+
+        n = self.left.transformation_count()
+        if i < n:
+            return OpTreeExpr(self.op, self.left.transformation(i), self.right)  # transform left
+        return OpTreeExpr(self.op, self.left, self.right.transformation(i - n))  # transform right
+
+    def random_transformation(self, rng: random.Random) -> Self | None:
+        '''same as `rng.choice(tuple(self.transformations()))` without building every transformation'''
+        n = self.transformation_count()
+        if n:
+            return self.transformation(rng.randrange(n))
+        return None
 
     def __call__(self, var: tuple[float]) -> float:
         '''evaluates the expression'''
@@ -184,44 +306,54 @@ class OpTreeExpr:
         return s
 
     def __eq__(self, other: Self) -> bool:
-        if self.op != other.op:
-            return False
-        elif self.op == "var":
-            return self.index == other.index
-        elif self.op == "const":
-            return self.val == other.val
-        else:
-            return self.left == other.left and self.right == other.right
+        # equal expressions are interned to the same object
+        return self is other
+
+    def __hash__(self) -> int:
+        return self.hash
+
+
+OpTreeExpr.set_slots = tuple(getattr(OpTreeExpr, name).__set__ for name in OpTreeExpr.__slots__[:-1])
+ONE = OpTreeExpr("const", 1)  # kept alive since it's used by every transformation
+
+
+def build(r: Rewrite) -> OpTreeExpr:
+    '''construct the expression described by a rewrite'''
+    if isinstance(r, OpTreeExpr):
+        return r
+    return OpTreeExpr(r[0], build(r[1]), build(r[2]))
 
 
 class OpTreeEq:
     '''represents a real equation'''
 
-    const_range = (-5, 10)  # range of parts in constants
-
-    def __init__(self, depth: int, iters: int, roots: tuple[None | float, ...], outermost: bool = True):
-        if not outermost and random.random() < 2 ** -depth:  # chance to be leaf node
+    def __init__(
+        self, depth: int, iters: int, roots: tuple[None | float, ...], outermost: bool = True,
+        rng: random.Random | None = None, config: ConfigEq = DEFAULT_CONFIG
+    ):
+        rng = rng or random.Random()
+        if not outermost and rng.random() < 2 ** -depth:  # chance to be leaf node
 
             root_dict = {i: x for i, x in enumerate(roots) if x is not None}
-            if root_dict and random.random() < 0.5:  # 50% chance to use a root
-                i, x = random.choice(tuple(root_dict.items()))
+            if root_dict and rng.random() < 0.5:  # 50% chance to use a root
+                i, x = rng.choice(tuple(root_dict.items()))
                 self.left = OpTreeExpr("var", i)
                 self.right = OpTreeExpr("const", x)
 
-                if random.random() < 0.5:  # swap sides
+                if rng.random() < 0.5:  # swap sides
                     self.left, self.right = self.right, self.left
             else:
                 x = 0
                 while x == 0:
-                    x = random.randint(*OpTreeEq.const_range)
+                    x = rng.randint(*config.const_range)
                 self.left = OpTreeExpr("const", x)
                 self.right = OpTreeExpr("const", x)
 
         else:
             while True:
-                op = weighted_random(OpTreeExpr.opers.items())
-                left_eq = OpTreeEq(depth - 1, 0, roots, outermost=False)
-                right_eq = OpTreeEq(depth - 1, 0, roots, outermost=False)
+                op = weighted_random(config.opers, rng)
+                left_eq = OpTreeEq(depth - 1, 0, roots, False, rng, config)
+                right_eq = OpTreeEq(depth - 1, 0, roots, False, rng, config)
                 self.left = OpTreeExpr(op, left_eq.left, right_eq.left)
                 self.right = OpTreeExpr(op, left_eq.right, right_eq.right)
 
@@ -230,21 +362,27 @@ class OpTreeEq:
                     break
 
                 # make sure roots is a root and it isn't true for all values of some variable
-                if self(roots) and not all(self(tuple_replace(roots, i, v+1)) for i, v in enumerate(roots) if v is not None):
+                stats.count("attempts")
+                if not self(roots):
+                    stats.count("rejected: not a root")
+                elif all(self(tuple_replace(roots, i, v+1)) for i, v in enumerate(roots) if v is not None):
+                    stats.count("rejected: true for all values")
+                else:
                     break
 
         if outermost:
-            self.transform(iters)
+            self.transform(iters, rng)
 
-    def transform(self, iters: int) -> None:
+    def transform(self, iters: int, rng: random.Random) -> None:
         '''slightly modifies both sides iters times but remains equivalent'''
         for _ in range(iters):
-            t = tuple(self.left.transformations())
-            if t:
-                self.left = random.choice(t)
-            t = tuple(self.right.transformations())
-            if t:
-                self.right = random.choice(t)
+            t = self.left.random_transformation(rng)
+            if t is not None:
+                self.left = t
+            t = self.right.random_transformation(rng)
+            if t is not None:
+                self.right = t
+
 
     def __call__(self, var: tuple[float, ...]) -> bool:
         '''returns wether var describes a solution'''
@@ -260,15 +398,22 @@ class OpTreeEq:
 
 class OpTreeEqSys:
     '''represents a system of real equations'''
-    root_range = (-5, 10)  # range of roots
 
-    def __init__(self, depth: int, iters: int, eqs: int):
-        roots = random_roots(eqs, OpTreeEqSys.root_range)
+    def __init__(
+        self, depth: int, iters: int, eqs: int, rng: random.Random | None = None, config: ConfigEq = DEFAULT_CONFIG
+    ):
+        rng = rng or random.Random()
+        roots = random_roots(eqs, config.root_range, rng)
         while True:
-            self.eqs = [OpTreeEq(depth, iters, roots) for _ in range(eqs)]
+            self.eqs = [OpTreeEq(depth, iters, roots, True, rng, config) for _ in range(eqs)]
 
             # make sure roots is a root and it isn't true for all values of a variable
-            if self(roots) and not any(self(tuple_replace(roots, i, v+1)) for i, v in enumerate(roots) if v is not None):
+            stats.count("system attempts")
+            if not self(roots):
+                stats.count("rejected: system not a root")
+            elif any(self(tuple_replace(roots, i, v+1)) for i, v in enumerate(roots) if v is not None):
+                stats.count("rejected: system true for all values of a variable")
+            else:
                 break
 
     def __call__(self, var: tuple[float, ...]) -> bool:
@@ -279,12 +424,33 @@ class OpTreeEqSys:
         '''represents the system as a string'''
         return "\n".join(str(eq) for eq in self.eqs)
 
+    def flatten(self) -> EquationsSpec:
+        '''both sides of every equation as flat trees, which are cheap to serialize'''
+        from flat_tree import FlatTree  # flat_tree imports this module
+        return tuple((FlatTree.from_tree(eq.left), FlatTree.from_tree(eq.right)) for eq in self.eqs)
+
+
+def canonical_equations(eqs: EquationsSpec) -> tuple[tuple[str, str], ...]:
+    '''the same for systems only differing in the order of equations, of their sides or of operands of + and *'''
+    return tuple(sorted(tuple(sorted((left.canonical(), right.canonical()))) for left, right in eqs))
+
 
-def get_eq(difficulty: int, **_):
-    eq = OpTreeEqSys(difficulty, difficulty, 1)
-    return f"Solve for x:\n\t{eq}\nx = ", lambda x: eq((parse_float(x),))
+@stats.measured("general eq")
+def get_eq(difficulty: int, rng: random.Random | None = None, config: ConfigEq = DEFAULT_CONFIG, **_):
+    eq = OpTreeEqSys(difficulty, difficulty, 1, rng, config)
+    spec = eq.flatten()
+    return Question(
+        f"Solve for x:\n\t{eq}\nx = ", "equation", spec, fingerprint("general eq", canonical_equations(spec))
+    )
 
 
-def get_eq_sys(difficulty: int, var_count: int, **_):
-    eq = OpTreeEqSys(difficulty, difficulty, var_count)
-    return f"Find a solution:\n\n{eq}\n\n{', '.join(OpTreeExpr.var_str[:var_count])} = ", lambda x: eq(parse_tuple(x))
+@stats.measured("system of eq")
+def get_eq_sys(
+    difficulty: int, var_count: int, rng: random.Random | None = None, config: ConfigEq = DEFAULT_CONFIG, **_
+):
+    eq = OpTreeEqSys(difficulty, difficulty, var_count, rng, config)
+    spec = eq.flatten()
+    return Question(
+        f"Find a solution:\n\n{eq}\n\n{', '.join(OpTreeExpr.var_str[:var_count])} = ", "system", spec,
+        fingerprint("system of eq", canonical_equations(spec))
+    )
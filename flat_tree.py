@@ -0,0 +1,349 @@
+import math
+from array import array
+from typing import Any, Self
+from collections.abc import Callable
+
+from c_arithmetic import OpTreeC, complex_str
+from eq_system import OpTreeExpr
+
+# operations, the opcode of an operation is its index
+OPCODES = ("const", "int", "var", "add", "sub", "mul", "div", "conj", "abs", "re", "im")
+CONST, INT, VAR, ADD, SUB, MUL, DIV, CONJ, ABS, RE, IM = range(len(OPCODES))
+
+# python operators of the binary operations, used when compiling
+OP_SYMBOLS = {ADD: "+", SUB: "-", MUL: "*", DIV: "/"}
+
+# array types operands can be stored as, smallest first
+ARG_TYPES = (("b", -2**7, 2**7), ("h", -2**15, 2**15), ("i", -2**31, 2**31))
+
+
+def literal(x: float) -> str:
+    '''python expression for a number, also for infinities and nan that have none'''
+    return f"({x!r})" if math.isfinite(x) else f"float('{x!r}')"
+
+
+def pack_args(args: list[float]) -> array:
+    '''store operands in the smallest array type that represents all of them exactly, -0.0 included'''
+    if all(float(x).is_integer() and (x != 0 or math.copysign(1, x) > 0) for x in args):
+        lo, hi = min(args, default=0), max(args, default=0)
+        for typecode, t_lo, t_hi in ARG_TYPES:
+            if t_lo <= lo and hi < t_hi:
+                return array(typecode, map(int, args))
+    return array("d", args)
+
+
+class FlatTree:
+    '''compact expression stored in postfix order as an array of opcodes and an array of operands
+    \n leaves take their operands from `args` in order: complex constants two numbers, other leaves one'''
+
+    __slots__ = ("is_complex", "ops", "args", "compiled")
+
+    def __init__(self, is_complex: bool, ops: array, args: array):
+        self.is_complex = is_complex  # OpTreeC rather than OpTreeExpr
+        self.ops = ops  # array("B") of opcodes
+        self.args = args  # array of constants and variable indices, see `pack_args`
+        self.compiled: Callable[[tuple[float, ...]], complex | float] | None = None  # cached result of `compile`
+
+    @classmethod
+    def from_tree(cls, tree: OpTreeC | OpTreeExpr) -> Self:
+        '''flatten an expression tree'''
+        is_complex = isinstance(tree, OpTreeC)
+        ops, args = array("B"), []
+
+        # iterative post-order traversal, children before their parent
+        stack = [(tree, False)]
+        while stack:
+            node, visited = stack.pop()
+            if node.op == "const":
+                if is_complex:
+                    ops.append(CONST)
+                    args += node.val.real, node.val.imag
+                else:
+                    ops.append(INT if isinstance(node.val, int) else CONST)
+                    args.append(node.val)
+            elif node.op == "var":
+                ops.append(VAR)
+                args.append(node.index)
+            elif visited:
+                ops.append(OPCODES.index(node.op))
+            else:
+                stack.append((node, True))
+                if node.right is not None:
+                    stack.append((node.right, False))
+                stack.append((node.left, False))
+
+        return cls(is_complex, ops, pack_args(args))
+
+    def to_tree(self) -> OpTreeC | OpTreeExpr:
+        '''rebuild the expression tree'''
+        stack = []
+        j = 0  # next operand in `args`
+        for op in self.ops:
+            if op <= VAR:
+                if op == VAR:
+                    stack.append(OpTreeExpr("var", int(self.args[j])))
+                elif self.is_complex:
+                    stack.append(OpTreeC.node("const", val=complex(self.args[j], self.args[j+1])))
+                    j += 1
+                else:
+                    stack.append(OpTreeExpr("const", int(self.args[j]) if op == INT else float(self.args[j])))
+                j += 1
+            else:
+                right = stack.pop() if op <= DIV else None
+                left = stack.pop()
+                if self.is_complex:
+                    node = OpTreeC.node(OPCODES[op], left, right)
+                    # values are gaussian integers, undo rounding errors in divisions
+                    node.val = complex(round(node.val.real), round(node.val.imag))
+                    stack.append(node)
+                else:
+                    stack.append(OpTreeExpr(OPCODES[op], left, right))
+        return stack.pop()
+
+    def __call__(self, var: tuple[float, ...] = ()) -> complex | float:
+        '''evaluates the expression, same as calling the tree'''
+        stack = []
+        push, pop = stack.append, stack.pop
+        args = self.args
+        j = 0
+        for op in self.ops:
+            if op <= VAR:
+                if op == VAR:
+                    i = int(args[j])
+                    if i >= len(var) or var[i] is None:
+                        raise ValueError("too few variables")
+                    push(var[i])
+                elif self.is_complex:
+                    push(complex(args[j], args[j+1]))
+                    j += 1
+                else:
+                    push(int(args[j]) if op == INT else float(args[j]))
+                j += 1
+            elif op <= DIV:
+                r = pop()
+                l = pop()
+                if op == ADD:
+                    push(l + r)
+                elif op == SUB:
+                    push(l - r)
+                elif op == MUL:
+                    push(l * r)
+                else:
+                    push(l / r)
+            else:
+                x = pop()
+                if op == CONJ:
+                    push(x.conjugate())
+                elif op == ABS:
+                    push(abs(x))
+                elif op == RE:
+                    push(complex(x.real, 0))
+                else:
+                    push(complex(x.imag, 0))
+        return pop()
+
+    def source(self) -> str:
+        '''python expression evaluating the expression given the variables in `v`'''
+        stack: list[str] = []
+        push, pop = stack.append, stack.pop
+        args = self.args
+        j = 0
+        for op in self.ops:
+            if op <= VAR:
+                if op == VAR:
+                    push(f"v[{int(args[j])}]")
+                elif self.is_complex:
+                    push(f"complex({literal(float(args[j]))}, {literal(float(args[j+1]))})")
+                    j += 1
+                else:
+                    push(f"({int(args[j])})" if op == INT else literal(float(args[j])))
+                j += 1
+            elif op <= DIV:
+                r = pop()
+                l = pop()
+                push(f"({l} {OP_SYMBOLS[op]} {r})")
+            else:
+                x = pop()
+                if op == CONJ:
+                    push(f"{x}.conjugate()")
+                elif op == ABS:
+                    push(f"abs({x})")
+                elif op == RE:
+                    push(f"complex({x}.real, 0)")
+                else:
+                    push(f"complex({x}.imag, 0)")
+        return pop()
+
+    def compile(self) -> Callable[[tuple[float, ...]], complex | float]:
+        '''equivalent of `self.__call__` as generated python code, cached on the tree
+        \n compiling costs about as much as a dozen calls, it pays off for trees evaluated repeatedly'''
+        if self.compiled is None:
+            code = (
+                "def f(v):\n"
+                "    if None in v:\n"  # missing variables raise before anything evaluated after them
+                "        return interpret(v)\n"
+                "    try:\n"
+                f"        return {self.source()}\n"
+                "    except (IndexError, TypeError):\n"
+                "        raise ValueError('too few variables') from None\n"
+            )
+            # a copy sharing the arrays, so the cache doesn't keep the tree in a reference cycle
+            interpret = FlatTree(self.is_complex, self.ops, self.args)
+            namespace = {"interpret": interpret}
+            try:
+                exec(code, namespace)
+            except (SyntaxError, RecursionError, MemoryError):
+                # too deeply nested for the parser, keep interpreting
+                namespace["f"] = interpret
+            self.compiled = namespace["f"]
+        return self.compiled
+
+    def variables(self) -> int:
+        '''one more than the largest variable index used, the number of values `__call__` needs'''
+        j, n = 0, 0
+        for op in self.ops:
+            if op == VAR:
+                n = max(n, int(self.args[j]) + 1)
+            if op <= VAR:
+                j += 2 if op == CONST and self.is_complex else 1
+        return n
+
+    def evaluate_many(self, var: tuple[Any, ...]) -> tuple[Any, Any]:
+        '''evaluates a real expression for many values at once, `var` holds a numpy array of values per variable
+        \n returns the values and a mask of where they're valid, false where `__call__` would divide by zero'''
+        import numpy as np
+
+        n = len(var[0]) if var else 1
+        valid = np.ones(n, dtype=bool)
+        stack = []
+        push, pop = stack.append, stack.pop
+        args = self.args
+        j = 0
+        for op in self.ops:
+            if op <= VAR:
+                if op == VAR:
+                    i = int(args[j])
+                    if i >= len(var):
+                        raise ValueError("too few variables")
+                    push(var[i])
+                else:
+                    push(int(args[j]) if op == INT else float(args[j]))
+                j += 1
+            else:
+                r = pop()
+                l = pop()
+                if op == ADD:
+                    push(l + r)
+                elif op == SUB:
+                    push(l - r)
+                elif op == MUL:
+                    push(l * r)
+                elif op == DIV:
+                    zero = np.equal(r, 0)
+                    valid &= ~zero
+                    if isinstance(r, np.ndarray):
+                        push(l / np.where(zero, 1, r))
+                    elif zero:
+                        push(l)  # a constant division by zero, every value is invalid
+                    else:
+                        push(l / r)
+                else:
+                    raise ValueError("only real expressions can be evaluated in bulk")
+        return np.broadcast_to(pop(), (n,)), valid
+
+    def __str__(self) -> str:
+        '''represent expression as a string, same as the tree'''
+        stack: list[tuple[str, int]] = []  # (string, opcode)
+        args = self.args
+        j = 0
+        for op in self.ops:
+            if op <= VAR:
+                if op == VAR:
+                    s = OpTreeExpr.var_str[int(args[j])]
+                elif self.is_complex:
+                    s = complex_str(complex(args[j], args[j+1]))
+                    j += 1
+                else:
+                    s = str(int(args[j]) if op == INT else float(args[j]))
+                j += 1
+            elif op <= DIV:
+                r = stack.pop()
+                l = stack.pop()
+                if op == ADD:
+                    s = f"{l[0]} + {r[0]}"
+                elif op == SUB:
+                    s = f"{l[0]} - {self.factor(*r)}"
+                elif op == MUL:
+                    s = f"{self.factor(*l)} * {self.factor(*r)}"
+                else:
+                    s = f"{self.factor(*l)} / ({r[0]})"
+            else:
+                x = stack.pop()[0]
+                if op == CONJ:
+                    s = f"conj({x})"
+                elif op == ABS:
+                    s = f"|{x}|"
+                elif op == RE:
+                    s = f"Re({x})"
+                else:
+                    s = f"Im({x})"
+            stack.append((s, op))
+        return stack.pop()[0]
+
+    def canonical(self) -> str:
+        '''string that is the same for expressions only differing in the order of the operands of + and *'''
+        stack: list[str] = []
+        args = self.args
+        j = 0
+        for op in self.ops:
+            if op <= VAR:
+                if op == VAR:
+                    s = f"x{int(args[j])}"
+                elif self.is_complex:
+                    s = repr(complex(args[j], args[j+1]))
+                    j += 1
+                else:
+                    s = repr(float(args[j]))  # 2 and 2.0 are the same
+                j += 1
+            elif op <= DIV:
+                r = stack.pop()
+                l = stack.pop()
+                if op in (ADD, MUL) and r < l:
+                    l, r = r, l
+                s = f"{OPCODES[op]}({l},{r})"
+            else:
+                s = f"{OPCODES[op]}({stack.pop()})"
+            stack.append(s)
+        return stack.pop()
+
+    def factor(self, s: str, op: int) -> str:
+        '''wrap a rendered subexpression in parenthesis when the tree's `__format__` would'''
+        if self.is_complex:
+            # same as OpTreeC.__format__ with "f"
+            wrap = (op == CONST and "-" in s) or "+" in s
+        else:
+            # same as OpTreeExpr.__format__ with "f"
+            wrap = op in (ADD, SUB) or (op in (CONST, INT) and "-" in s)
+        return f"({s})" if wrap else s
+
+    def to_bytes(self) -> bytes:
+        '''serialize as kind, operand type and opcode count followed by the opcodes and the operands'''
+        n = len(self.ops)
+        header = bytes((self.is_complex,)) + self.args.typecode.encode() + n.to_bytes(4, "little")
+        return header + self.ops.tobytes() + self.args.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> Self:
+        '''inverse of `to_bytes`'''
+        n = int.from_bytes(data[2:6], "little")
+        ops, args = array("B"), array(chr(data[1]))
+        ops.frombytes(data[6:6+n])
+        args.frombytes(data[6+n:])
+        return cls(bool(data[0]), ops, args)
+
+    def __reduce__(self):
+        return FlatTree.from_bytes, (self.to_bytes(),)
+
+    def __len__(self) -> int:
+        '''number of nodes'''
+        return len(self.ops)
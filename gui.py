@@ -1,84 +1,131 @@
 import tkinter as tk
 from tkinter import ttk
 from sys import platform
-from collections.abc import Callable
 
-# (question, grading function)
-type Question = tuple[str, Callable[[str], bool]]
+import tracing
+from question import Question
+
+_root: tk.Tk | None = None
+_window: "QuestionWindow | None" = None
 
 
 def disable_event():
     pass
 
 
-def validate(grade: Callable[[str], bool], error: ttk.Label, root: tk.Tk):
-    def f(event: tk.Event):
-        entry: ttk.Entry = event.widget
-        ans = entry.get()
+def get_root() -> tk.Tk:
+    '''hidden Tk root shared by every window, created once so the Tcl interpreter is only started once'''
+    global _root
+    if _root is None:
+        _root = tk.Tk()
+        _root.withdraw()  # only its child windows are shown
+    return _root
+
+
+def center_geometry(win: tk.Misc, width: int, height: int) -> str:
+    '''geometry string placing a window of the given size in the middle of the screen'''
+    x_cord = (win.winfo_screenwidth() - width) // 2  # horizontal offset
+    y_cord = (win.winfo_screenheight() - height) // 2  # vertical offset
+    return f"{width}x{height}+{x_cord}+{y_cord}"
+
+
+class QuestionWindow:
+    '''the popup questions are asked in, built once then hidden between questions and shown again with new text'''
+
+    width = 500  # window width
+    height = 500  # window height
+
+    def __init__(self, root: tk.Tk):
+        start = tracing.now()
+        win = self.win = tk.Toplevel(root)  # new window
+        win.withdraw()  # hidden until there's a question
+        win.title("MathLock")  # rename window
+        win.resizable(False, False)  # disable resizing
+        win.attributes("-topmost", True)  # always on top
+
+        # disable closing
+        win.protocol("WM_DELETE_WINDOW", disable_event)
+
+        # disable minimizing
+        if platform == "win32":
+            # windows
+            win.overrideredirect(True)
+            win.attributes("-toolwindow", True)
+        else:
+            # linux
+            win.attributes("-type", "toolbar")
+
+        win.geometry(center_geometry(win, self.width, self.height))  # resize and reposition
+
+        # create widgets
+        center = ttk.Frame(win)
+        self.number = ttk.Label(center)
+        seperator = ttk.Separator(center)
+        self.label = ttk.Label(center, wraplength=int(self.width * 0.9))
+        self.entry = ttk.Entry(center)
+        self.error = ttk.Label(center)
+
+        # bind enter to submit
+        self.entry.bind("<Return>", self.submit)
+        win.bind("<Map>", self.mapped)
+
+        # add widgets
+        self.number.pack()
+        seperator.pack(fill="x")
+        self.label.pack()
+        self.entry.pack()
+        self.error.pack()
+        center.place(relx=0.5, rely=0.5, anchor="center")
+
+        self.grade = None  # grading function of the current question
+        self.shown_at: float | None = None  # trace time the current question was shown, until it's drawn
+        tracing.complete("build window", start)
+
+    def ask(self, q: Question, i: int) -> None:
+        '''show the question and return once it has been answered correctly'''
+        self.shown_at = start = tracing.now()
+        self.grade = q.grade
+        self.number.config(text=f"Question #{i+1}")
+        self.label.config(text=q.text)
+        self.error.config(text="")
+        self.entry.delete(0, "end")
+
+        self.win.deiconify()  # show window
+        self.win.lift()
+        self.entry.focus_force()  # focus on text box
+        self.win.mainloop()  # until `submit` quits it
+        self.win.withdraw()  # hide until the next question
+        tracing.complete("question", start, question=i)
+
+    def mapped(self, event: tk.Event) -> None:
+        '''the window was drawn'''
+        if event.widget is self.win and self.shown_at is not None:
+            tracing.complete("first paint", self.shown_at)
+            self.shown_at = None
+
+    def submit(self, event: tk.Event) -> None:
+        '''grade the answer in the text box'''
+        ans = self.entry.get()
 
         # make sure it can be closed still
         if ans == "q":
             quit()
 
         try:
-            correct = grade(ans)
+            with tracing.span("grade", answer=ans):
+                correct = self.grade(ans)
         except ValueError as e:
-            error.config(text=f"Error: {e}")
+            self.error.config(text=f"Error: {e}")
         else:
             if correct:
-                # close window
-                root.destroy()
-                root.quit()
+                self.win.quit()  # return from `ask`
             else:
-                error.config(text=f"Incorrect, try again.")
-    return f
+                self.error.config(text=f"Incorrect, try again.")
 
 
 def give_question(q: Question, i: int) -> None:
     '''notify and give user question until they get it right'''
-    win = tk.Tk()  # new window
-    win.title("MathLock")  # rename window
-    win.resizable(False, False)  # disable resizing
-    win.attributes("-topmost", True)  # always on top
-
-    # disable closing
-    win.protocol("WM_DELETE_WINDOW", disable_event)
-
-    # disable minimizing
-    if platform == "win32":
-        # windows
-        win.overrideredirect(True)
-        win.attributes("-toolwindow", True)
-    else:
-        # linux
-        win.attributes("-type", "toolbar")
-
-    win_width = 500  # window width
-    win_height = 500  # window height
-    screen_width = win.winfo_screenwidth()
-    screen_height = win.winfo_screenheight()
-    x_cord = (screen_width - win_width) // 2  # horizontal offset
-    y_cord = (screen_height - win_height) // 2  # vertical offset
-    win.geometry(f"{win_width}x{win_height}+{x_cord}+{y_cord}")  # resize and reposition
-
-    # create widgets
-    center = ttk.Frame(win)
-    number = ttk.Label(center, text=f"Question #{i+1}")
-    seperator = ttk.Separator(center)
-    label = ttk.Label(center, text=q[0], wraplength=int(win_width * 0.9))
-    entry = ttk.Entry(center)
-    error = ttk.Label(center)
-
-    # bind enter to submit
-    entry.bind("<Return>", validate(q[1], error, win))
-    entry.focus()  # focus on text box, doesn't seem to work on Ubuntu at least
-
-    # add widgets
-    number.pack()
-    seperator.pack(fill="x")
-    label.pack()
-    entry.pack()
-    error.pack()
-    center.place(relx=0.5, rely=0.5, anchor="center")
-
-    win.mainloop()  # show window
+    global _window
+    if _window is None:
+        _window = QuestionWindow(get_root())
+    _window.ask(q, i)
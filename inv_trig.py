@@ -1,7 +1,28 @@
+import os
+import pickle
 import random
 import re
+import threading
+from array import array
+from dataclasses import dataclass
 
-const_range = (-5, 10)
+import stats
+from dedup import fingerprint
+from question import Question
+
+
+@dataclass(frozen=True)
+class ConfigTrig:
+    '''settings for generating trigonometric equations'''
+
+    const_range: tuple[int, int] = (-5, 10)  # range of coefficients and constants
+
+
+DEFAULT_CONFIG = ConfigTrig()
+
+# where the precomputed table of all trig equations is cached
+TABLE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "mathlock")
+TABLE_VERSION = 1
 
 type RealConst = tuple[float, float]  # a + b pi
 type LinExpr = tuple[RealConst, RealConst]  # a x + b
@@ -10,10 +31,10 @@ type TrigEq = tuple[TrigExpr, TrigExpr]  # f = g
 type TrigAns = tuple[LinExpr, LinExpr]  # f or g
 
 
-def generate_lin_expr() -> LinExpr:
+def generate_lin_expr(rng: random.Random, config: ConfigTrig = DEFAULT_CONFIG) -> LinExpr:
     '''generate a linear expression with no multiples of pi'''
-    x = float(random.randint(*const_range)), 0
-    c = float(random.randint(*const_range)), 0
+    x = float(rng.randint(*config.const_range)), 0
+    c = float(rng.randint(*config.const_range)), 0
     return x, c
 
 
@@ -46,9 +67,9 @@ def lin_expr_str(x: LinExpr) -> str:
         return f"{real_str(x[0])}x + {real_str(x[1])}"  # a x + c
 
 
-def generate_trig_expr() -> TrigExpr:
+def generate_trig_expr(rng: random.Random, config: ConfigTrig = DEFAULT_CONFIG) -> TrigExpr:
     '''generate a trig function with linear input'''
-    return random.random() < 0.5, generate_lin_expr()
+    return rng.random() < 0.5, generate_lin_expr(rng, config)
 
 
 def trig_expr_str(x: TrigExpr) -> str:
@@ -56,14 +77,16 @@ def trig_expr_str(x: TrigExpr) -> str:
     return f"{'sin' if x[0] else 'cos'}({lin_expr_str(x[1])})"
 
 
-def generate_trig_eq() -> TrigEq:
+def generate_trig_eq(rng: random.Random, config: ConfigTrig = DEFAULT_CONFIG) -> TrigEq:
     '''generate a random trigonometric equation'''
     while True:
-        l = generate_trig_expr()
-        r = generate_trig_expr()
+        stats.count("attempts")
+        l = generate_trig_expr(rng, config)
+        r = generate_trig_expr(rng, config)
         # make sure solutions exist
         if abs(l[1][0][0]) != abs(r[1][0][0]):
             return l, r
+        stats.count("rejected: no solutions")
 
 
 def trig_eq_str(x: TrigEq) -> str:
@@ -71,6 +94,21 @@ def trig_eq_str(x: TrigEq) -> str:
     return f"{trig_expr_str(x[0])} = {trig_expr_str(x[1])}"
 
 
+def canonical_side(x: TrigExpr) -> tuple[bool, float, float, float, float]:
+    '''the same for trig expressions only differing in the sign of the input of cos'''
+    sin, ((a, b), (c, d)) = x
+    side = float(a), float(b), float(c), float(d)
+    if not sin:
+        # cos(f) = cos(-f), 0.0 - v rather than -v so zero stays 0.0 rather than -0.0
+        side = max(side, tuple(0.0 - v for v in side))
+    return (sin, *side)
+
+
+def canonical_trig(x: TrigEq) -> tuple[tuple[bool, float, float, float, float], ...]:
+    '''the same for equations only differing in the order of their sides or the sign of the input of cos'''
+    return tuple(sorted(canonical_side(side) for side in x))
+
+
 def trig_to_cos(x: TrigExpr) -> TrigExpr:
     '''apply sin(x) = cos(pi-x) if possible'''
     sin, ((a, b), (c, d)) = x
@@ -111,7 +149,10 @@ def parse_rational(x: str, default: float) -> float:
     '''interpret string as float or quotient of floats'''
     if "/" in x:
         a, b = x.split("/")
-        return float(a) / float(b)
+        try:
+            return float(a) / float(b)
+        except ZeroDivisionError:
+            raise ValueError("division by zero")
     elif x.strip():
         return float(x)
     else:
@@ -173,10 +214,10 @@ def standardise(x: LinExpr) -> LinExpr:
     return (a, b), (c, d)
 
 
-def validate_one(x: LinExpr, y: LinExpr) -> bool:
-    '''compare one case of trigonometric solutions'''
+def validate_one(x: LinExpr, y: LinExpr, standardised: bool = False) -> bool:
+    '''compare one case of trigonometric solutions, `y` may already be standardised'''
     (xa, xb), (xc, xd) = standardise(x)
-    (ya, yb), (yc, yd) = standardise(y)
+    (ya, yb), (yc, yd) = y if standardised else standardise(y)
 
     # add leniency
     xa = round(xa, 5)
@@ -191,15 +232,197 @@ def validate_one(x: LinExpr, y: LinExpr) -> bool:
     return xa == ya and xb == yb and xc == yc and xd == yd
 
 
-def validate(a: TrigAns, b: TrigAns) -> bool:
-    '''compare both cases of trigonometric solutions'''
+def validate(a: TrigAns, b: TrigAns, standardised: bool = False) -> bool:
+    '''compare both cases of trigonometric solutions, `b` may already be standardised'''
     return (
-        (validate_one(a[0], b[0]) and validate_one(a[1], b[1]))
-        or (validate_one(a[0], b[1]) and validate_one(a[1], b[0]))
+        (validate_one(a[0], b[0], standardised) and validate_one(a[1], b[1], standardised))
+        or (validate_one(a[0], b[1], standardised) and validate_one(a[1], b[0], standardised))
+    )
+
+
+class TrigTable:
+    '''every valid trig equation over `const_range` together with its standardised solutions'''
+
+    def __init__(self, const_range: tuple[int, int]):
+        self.const_range = const_range
+        self.width = const_range[1] - const_range[0] + 1  # number of possible constants
+        self.codes = array("I")  # equations packed as mixed radix integers, see `encode`
+        self.answers = array("H")  # two indices into `solutions` per equation
+        self.solutions = array("d")  # distinct standardised solutions, four floats each
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def encode(self, x: TrigEq) -> int:
+        '''pack an equation into an integer'''
+        code = 0
+        for sin, ((a, _), (c, _)) in x:
+            code = code * 2 + sin
+            code = code * self.width + int(a) - self.const_range[0]
+            code = code * self.width + int(c) - self.const_range[0]
+        return code
+
+    def decode(self, code: int) -> TrigEq:
+        '''unpack an equation packed by `encode`'''
+        sides = []
+        for _ in range(2):
+            code, c = divmod(code, self.width)
+            code, a = divmod(code, self.width)
+            code, sin = divmod(code, 2)
+            sides.append((bool(sin), ((float(a + self.const_range[0]), 0), (float(c + self.const_range[0]), 0))))
+        return sides[1], sides[0]
+
+    def build(self) -> None:
+        '''enumerate and solve every equation `generate_trig_eq` can return'''
+        index: dict[LinExpr, int] = {}  # standardised solution -> index in `solutions`
+        for code in range((2 * self.width * self.width) ** 2):
+            x = self.decode(code)
+            if abs(x[0][1][0][0]) == abs(x[1][1][0][0]):
+                continue  # no solutions
+
+            self.codes.append(code)
+            for ans in solve_trig_eq(x):
+                ans = standardise(ans)
+                if ans not in index:
+                    index[ans] = len(index)
+                    self.solutions.extend((*ans[0], *ans[1]))
+                self.answers.append(index[ans])
+
+    def eq(self, i: int) -> TrigEq:
+        '''equation number `i`'''
+        return self.decode(self.codes[i])
+
+    def answer(self, i: int) -> TrigAns:
+        '''standardised solutions to equation number `i`'''
+        ans = []
+        for j in self.answers[2*i:2*i+2]:
+            a, b, c, d = self.solutions[4*j:4*j+4]
+            ans.append(((a, b), (c, d)))
+        return ans[0], ans[1]
+
+    def path(self) -> str:
+        '''file the table is cached in'''
+        return os.path.join(TABLE_DIR, f"inv_trig_{self.const_range[0]}_{self.const_range[1]}.pickle")
+
+    def load(self) -> bool:
+        '''read the table from the disk cache, returns wether it was found'''
+        try:
+            with open(self.path(), "rb") as f:
+                version, self.codes, self.answers, self.solutions = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            return False
+        return version == TABLE_VERSION
+
+    def save(self) -> None:
+        '''write the table to the disk cache, silently skipped if not possible'''
+        try:
+            os.makedirs(TABLE_DIR, exist_ok=True)
+            tmp = f"{self.path()}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                pickle.dump((TABLE_VERSION, self.codes, self.answers, self.solutions), f)
+            os.replace(tmp, self.path())
+        except OSError:
+            pass
+
+
+_tables: dict[tuple[int, int], TrigTable] = {}
+_tables_lock = threading.Lock()
+
+
+def trig_table(config: ConfigTrig = DEFAULT_CONFIG) -> TrigTable:
+    '''the table for `config.const_range`, loaded from disk or built on first use'''
+    with _tables_lock:
+        if config.const_range not in _tables:
+            table = TrigTable(config.const_range)
+            if not table.load():
+                table = TrigTable(config.const_range)
+                table.build()
+                table.save()
+            _tables[config.const_range] = table
+        return _tables[config.const_range]
+
+
+@stats.measured("inverse trig")
+def get_inv_trig(
+    precomputed: bool = False, rng: random.Random | None = None, config: ConfigTrig = DEFAULT_CONFIG, **_
+):
+    rng = rng or random.Random()
+    if precomputed:
+        # sample uniformly among all equations, same distribution as `generate_trig_eq`
+        table = trig_table(config)
+        i = rng.randrange(len(table))
+        eq = table.eq(i)
+        ans = table.answer(i)
+    else:
+        eq = generate_trig_eq(rng, config)
+        ans = solve_trig_eq(eq)
+    return Question(
+        f"Find all values of x for integers n such that\n\t{trig_eq_str(eq)}\nx1, x2 = ", "trig", (ans, precomputed),
+        fingerprint("inverse trig", canonical_trig(eq))
     )
 
 
-def get_inv_trig(**_):
-    eq = generate_trig_eq()
-    ans = solve_trig_eq(eq)
-    return f"Find all values of x for integers n such that\n\t{trig_eq_str(eq)}\nx1, x2 = ", lambda x: validate(parse_solutions(x), ans)
+@stats.measured("inverse trig batch")
+def get_inv_trig_batch(
+    n: int, rng: random.Random | None = None, config: ConfigTrig = DEFAULT_CONFIG, **_
+) -> list[Question]:
+    '''`n` questions like `get_inv_trig`, generated and solved together with numpy
+    \n falls back to `get_inv_trig` if numpy isn't installed'''
+    rng = rng or random.Random()
+    try:
+        import numpy as np  # only needed here, slow to import
+    except ImportError:
+        return [get_inv_trig(rng=rng, config=config) for _ in range(n)]
+
+    np_rng = np.random.default_rng(rng.getrandbits(64))
+    lo, hi = config.const_range
+
+    # rows of (left sin, right sin) and (left a, left c, right a, right c), same as `generate_trig_eq`
+    sins, coeffs = np.empty((0, 2), dtype=bool), np.empty((0, 4))
+    while len(sins) < n:
+        m = n - len(sins)
+        s = np_rng.random((m, 2)) < 0.5
+        k = np_rng.integers(lo, hi, size=(m, 4), endpoint=True).astype(float)
+        ok = np.abs(k[:, 0]) != np.abs(k[:, 2])  # make sure solutions exist
+        stats.count("attempts", m)
+        stats.count("rejected: no solutions", m - int(ok.sum()))
+        sins, coeffs = np.concatenate((sins, s[ok])), np.concatenate((coeffs, k[ok]))
+
+    # same as `trig_to_cos`, which leaves the multiples of pi of a and c at zero
+    sign = np.where(sins, -1.0, 1.0)
+    (la, ra), (lc, rc) = (coeffs[:, [0, 2]] * sign).T, (coeffs[:, [1, 3]] * sign).T
+    ld, rd = np.where(sins, 0.5, 0.0).T
+
+    # same as `solve_trig_eq`, rows of (a, b, c, d) for a + b pi + (c + d pi) n
+    zero = np.zeros(n)
+    ans1 = np.stack(((rc - lc)/(la - ra), (rd - ld)/(la - ra), zero, 2/(la - ra)), axis=1)
+    ans2 = np.stack((-(rc + lc)/(la + ra), -(rd + ld)/(la + ra), zero, 2/(la + ra)), axis=1)
+
+    for ans in (ans1, ans2):
+        # same as `standardise`, floor division of floats rounds like python's
+        a, b, c, d = ans.T
+        flip = (c < 0) | ((c == 0) & (d < 0))
+        c[flip], d[flip] = -c[flip], -d[flip]
+        steps = np.where(c != 0, np.floor_divide(a, np.where(c != 0, c, 1)), np.floor_divide(b, np.where(d != 0, d, 1)))
+        steps[(c == 0) & (d == 0)] = 0
+        ans[:, 0], ans[:, 1] = a - c * steps, b - d * steps
+
+    # only 2 * width^2 distinct sides exist, render and canonicalise each of them once
+    width = hi - lo + 1
+    codes = (sins * width + (coeffs[:, [0, 2]] - lo)) * width + (coeffs[:, [1, 3]] - lo)
+    sides = [
+        (bool(sin), ((float(a + lo), 0), (float(c + lo), 0)))
+        for sin in range(2) for a in range(width) for c in range(width)
+    ]
+    strings = [trig_expr_str(side) for side in sides]
+    canonical = [canonical_side(side) for side in sides]
+    return [
+        Question(
+            f"Find all values of x for integers n such that\n\t{strings[l]} = {strings[r]}\nx1, x2 = ",
+            "trig", ((((a1, b1), (c1, d1)), ((a2, b2), (c2, d2))), True),
+            fingerprint("inverse trig", tuple(sorted((canonical[l], canonical[r]))))
+        )
+        for (l, r), (a1, b1, c1, d1), (a2, b2, c2, d2) in zip(
+            codes.astype(int).tolist(), ans1.tolist(), ans2.tolist()
+        )
+    ]
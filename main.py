@@ -1,28 +1,44 @@
-from c_arithmetic import get_complex
-from eq_system import get_eq, get_eq_sys
-from poly_eq import get_poly, get_poly_div
-from inv_trig import get_inv_trig
-
-import time
+import sys
 import random
-from collections.abc import Callable
+import importlib
+from collections.abc import Callable, Mapping
 from typing import Any
 
-from start_menu_gui import start_menu
-from gui import give_question
+from question_pool import QuestionPool
+from scheduler import Scheduler
+from question import Question
+import tracing
+
+
+class Generators(Mapping[str, Callable[..., Question]]):
+    '''question generators by name, a generator's module is only imported when it's first used'''
+
+    def __init__(self, paths: dict[str, str]):
+        self.paths = paths  # "module.function" of every generator
+        self.loaded: dict[str, Callable[..., Question]] = {}
+
+    def __getitem__(self, name: str) -> Callable[..., Question]:
+        if name not in self.loaded:
+            module, _, function = self.paths[name].rpartition(".")
+            self.loaded[name] = getattr(importlib.import_module(module), function)
+        return self.loaded[name]
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __len__(self) -> int:
+        return len(self.paths)
 
-# (question, grading function)
-type Question = tuple[str, Callable[[str], bool]]
 
 # (name, function to question)
-EQ_TYPES: dict[str, Callable[[], Question]] = {
-    "complex arithmetic": get_complex,  # working
-    "general eq": get_eq,  # working
-    "system of eq": get_eq_sys,  # working
-    "second deg polynomials": get_poly,  # working
-    "polynomial div": get_poly_div,  # working
-    "inverse trig": get_inv_trig,  # working
-}
+EQ_TYPES = Generators({
+    "complex arithmetic": "c_arithmetic.get_complex",  # working
+    "general eq": "eq_system.get_eq",  # working
+    "system of eq": "eq_system.get_eq_sys",  # working
+    "second deg polynomials": "poly_eq.get_poly",  # working
+    "polynomial div": "poly_eq.get_poly_div",  # working
+    "inverse trig": "inv_trig.get_inv_trig",  # working
+})
 
 # arguments to get_{equation type} functions
 OPTIONS: dict[Any] = {
@@ -31,27 +47,56 @@ OPTIONS: dict[Any] = {
     "var_count": 3
 }
 
+# "fixed" to ask every sleep_time seconds, "after_answer" to wait sleep_time seconds after every answer
+SCHEDULE_POLICY = "fixed"
+
+# pre-generated questions, topped up while waiting for the next popup
+POOL = QuestionPool(EQ_TYPES, low=2, high=8, processes=1)
+
 
 def get_question(types: tuple[str], options: dict[Any]) -> Question:
-    '''generate and return a random question from among the types'''
-    return EQ_TYPES[random.choice(types)](**options)
+    '''return a random question from among the types, pre-generated if possible'''
+    eq_type = random.choice(types)
+    with tracing.span("get_question", type=eq_type):
+        return POOL.get(eq_type, options)
 
 
-def run_periodically(f: Callable[[], None], T: float):
-    i = 0
-    while True:
-        time.sleep(T)  # wait one period
-        f(i)  # run
-        i += 1  # advance counter
+def make_question(eq_type: str, options: dict[Any], seed: int | None = None) -> Question:
+    '''generate a question, the same seed, type and options always give the same question'''
+    return EQ_TYPES[eq_type](**options, rng=random.Random(seed))
 
 
 def main() -> None:
+    # only the interface that is used is imported, the terminal one doesn't load tk at all
+    if "--cli" in sys.argv[1:]:
+        from start_menu import start_menu
+        from cli import give_question
+    else:
+        from start_menu_gui import start_menu
+        from gui import give_question
+    from question_bank import open_bank
+    from dedup import BloomFilter
+
     options = start_menu(tuple(EQ_TYPES.keys()))
     if "difficulty" in options.keys():
         OPTIONS["difficulty"] = options["difficulty"]
 
+    # start from the questions left over by the last run, the pool saves new ones as it generates them
+    POOL.bank = open_bank()
+    POOL.seen = BloomFilter(capacity=100_000)  # don't ask the same question twice in a session
+
+    # start generating before the first period
+    for t in options["types"]:
+        POOL.register(t, OPTIONS)
+    POOL.start()
+
     print()
-    run_periodically(lambda i: give_question(get_question(options["types"], OPTIONS), i), options["sleep_time"])
+    scheduler = Scheduler(options["sleep_time"], SCHEDULE_POLICY, pool=POOL)
+    try:
+        scheduler.run(lambda i: get_question(options["types"], OPTIONS), give_question)
+    finally:
+        # before the interpreter shuts the worker processes down under the filler, e.g. on ctrl-c
+        POOL.stop()
 
 
 if __name__ == "__main__":
@@ -1,32 +1,98 @@
 from itertools import zip_longest
-from random import randint
+from random import Random
+from dataclasses import dataclass
 
-ROOT_MIN = -5
-ROOT_MAX = 5
+import stats
+from dedup import fingerprint
+from question import Question
 
 
-def get_poly(degree: int = 2, difficulty: int = 1, **_):
-    roots = random_ints(degree, ROOT_MIN * difficulty, ROOT_MAX * difficulty)
-    eq = randomize_eq(poly_from_roots(roots))
-    return f"Find all roots for the equation:\n\t{eq}\nx = ", lambda x: parse_ints(x) == set(roots)
+@dataclass(frozen=True)
+class ConfigPoly:
+    '''settings for generating polynomial equations'''
 
+    root_min: int = -5  # smallest root at difficulty 1
+    root_max: int = 5  # largest root at difficulty 1
 
-def get_poly_div(degree: int = 2, difficulty: int = 1, **_):
-    roots = random_ints(degree + 1, ROOT_MIN * difficulty, ROOT_MAX * difficulty)
+
+DEFAULT_CONFIG = ConfigPoly()
+
+
+@stats.measured("second deg polynomials")
+def get_poly(degree: int = 2, difficulty: int = 1, rng: Random | None = None, config: ConfigPoly = DEFAULT_CONFIG, **_):
+    rng = rng or Random()
+    roots = random_ints(degree, config.root_min * difficulty, config.root_max * difficulty, rng)
+    eq = randomize_eq(poly_from_roots(roots), rng)
+    return Question(
+        f"Find all roots for the equation:\n\t{eq}\nx = ", "roots", frozenset(roots),
+        fingerprint("second deg polynomials", tuple(sorted(roots)))  # the multiset of roots
+    )
+
+
+@stats.measured("polynomial div")
+def get_poly_div(
+    degree: int = 2, difficulty: int = 1, rng: Random | None = None, config: ConfigPoly = DEFAULT_CONFIG, **_
+):
+    rng = rng or Random()
+    roots = random_ints(degree + 1, config.root_min * difficulty, config.root_max * difficulty, rng)
     eq = f"{poly_string(poly_from_roots(roots))} = 0"
     revealed_roots = []
     for i in range(1):
         revealed_roots.append(roots[i])
+    key = fingerprint("polynomial div", (tuple(revealed_roots), tuple(sorted(roots))))
     
     for root in revealed_roots:
         roots.remove(root)
-    return f"An equation has the known roots {revealed_roots}, find all remaining roots for the equation:\n\t{eq}\nx = ", lambda x: parse_ints(x) == set(roots)
-
-
-def randomize_eq(p):
+    return Question(
+        f"An equation has the known roots {revealed_roots}, find all remaining roots for the equation:\n\t{eq}\nx = ",
+        "roots", frozenset(roots), key
+    )
+
+
+def get_poly_batch(
+    n: int, degree: int = 2, difficulty: int = 1, rng: Random | None = None, config: ConfigPoly = DEFAULT_CONFIG, **_
+) -> list[Question]:
+    '''`n` questions like `get_poly`, generated together with numpy
+    \n falls back to `get_poly` if numpy isn't installed or coefficients could overflow 64 bit integers'''
+    rng = rng or Random()
+    lo, hi = config.root_min * difficulty, config.root_max * difficulty
+    # coefficients are at most prod(1 + |root|), and the randomized left side twice that
+    if 2 * (1 + max(abs(lo), abs(hi))) ** degree >= 2 ** 63:
+        return [get_poly(degree, difficulty, rng, config) for _ in range(n)]
+    try:
+        import numpy as np  # only needed here, slow to import
+    except ImportError:
+        return [get_poly(degree, difficulty, rng, config) for _ in range(n)]
+
+    np_rng = np.random.default_rng(rng.getrandbits(64))
+    roots = np_rng.integers(lo, hi, size=(n, degree), endpoint=True)
+
+    # multiply in one (x - root) factor per step for all questions at once, coefficients lowest first
+    p = np.ones((n, 1), dtype=np.int64)
+    for k in range(degree):
+        q = np.zeros((n, k + 2), dtype=np.int64)
+        q[:, 1:] = p
+        q[:, :-1] -= p * roots[:, k:k+1]
+        p = q
+
+    # same as `randomize_eq`
+    coeff_range = p.max(axis=1, keepdims=True)
+    right = np_rng.integers(-coeff_range, coeff_range, size=p.shape, endpoint=True)
+    left = p + right
+
+    return [
+        Question(
+            f"Find all roots for the equation:\n\t{poly_string(l)} = {poly_string(r)}\nx = ", "roots", frozenset(x),
+            fingerprint("second deg polynomials", tuple(sorted(x)))
+        )
+        for l, r, x in zip(left.tolist(), right.tolist(), roots.tolist())
+    ]
+
+
+def randomize_eq(p, rng: Random):
     eq_left = p
     coeffRange = max(eq_left)
-    eq_right = random_ints(len(p), -coeffRange, coeffRange)
+    eq_right = random_ints(len(p), -coeffRange, coeffRange, rng)
     eq_left = poly_add(eq_left, eq_right)
     eq = f"{poly_string(eq_left)} = {poly_string(eq_right)}" 
     return eq
@@ -40,10 +106,7 @@ def parse_ints(x: str) -> set[int]:
 
 
 def poly_from_roots(roots: list[int]):
-    factors = []
-    for root in roots:
-        factors.append([-root, 1])
-    return poly_prod(*factors)
+    return poly_prod(*([-root, 1] for root in roots))
 
 
 def poly_add(p1: list[int], p2: list[int]) -> list[int]:
@@ -59,39 +122,108 @@ def poly_sum(*polynomials: list[int]):
     return res
 
 
+# below this many coefficients in the shorter polynomial the schoolbook product is faster than packing
+KRONECKER_MIN = 16
+
+
 def poly_mult(p1: list[int], p2: list[int]):
     '''returns product of two polynomials'''
-    polynomials = []
-    for exponent, coeff1 in (enumerate(p1, 0)):
-        current_poly = [0] * exponent
-        for coeff2 in p2:
-            current_poly.append(coeff1 * coeff2)
-        polynomials.append(current_poly)
-
-    return poly_sum(*polynomials)
+    if not p1 or not p2:
+        return []
+    if min(len(p1), len(p2)) < KRONECKER_MIN:
+        res = [0] * (len(p1) + len(p2) - 1)
+        for i, coeff1 in enumerate(p1):
+            if coeff1:
+                for j, coeff2 in enumerate(p2, i):
+                    res[j] += coeff1 * coeff2
+        return res
+    return kronecker_mult(p1, p2)
+
+
+def kronecker_mult(p1: list[int], p2: list[int]) -> list[int]:
+    '''product of two polynomials by Kronecker substitution
+    \n both are evaluated at a large power of two so one big integer multiplication does the convolution'''
+    # every product coefficient, shifted to be non-negative, fits in a slot of `size` bytes
+    bound = max(map(abs, p1)) * max(map(abs, p2)) * min(len(p1), len(p2))
+    if bound == 0:  # one factor is zero, the other wouldn't fit in empty slots
+        return [0] * (len(p1) + len(p2) - 1)
+    size = (bound.bit_length() + 2 + 7) // 8
+    half = 1 << (8 * size - 1)
+
+    product = kronecker_pack(p1, size) * kronecker_pack(p2, size)
+    n = len(p1) + len(p2) - 1
+    # adding half to every slot makes the slots non-negative so they can be read as unsigned bytes
+    data = (product + int.from_bytes(half.to_bytes(size, "little") * n, "little")).to_bytes(size * n, "little")
+    return [int.from_bytes(data[i:i+size], "little") - half for i in range(0, size * n, size)]
+
+
+def kronecker_pack(p: list[int], size: int) -> int:
+    '''evaluate a polynomial at 2 ** (8 * size), coefficients must fit in `size` bytes'''
+    pos = b"".join(max(c, 0).to_bytes(size, "little") for c in p)
+    neg = b"".join(max(-c, 0).to_bytes(size, "little") for c in p)
+    return int.from_bytes(pos, "little") - int.from_bytes(neg, "little")
 
 
 def poly_prod(*factors: list[int]):
-    '''returns product of any number of polynomials'''
-    res = [1]
-    for p in factors:
-        res = poly_mult(res, p)
-    return res
-
-
-def poly_string(polynomial: list[int]) -> str:
-    '''returns string of a polynomial expression from a list of its coefficients, e.g [c,b,a] -> "ax^2 + bx + c"'''
-    poly_string = " "
-    for exponent, coeff in reversed(list(enumerate(polynomial, 0))):
-        poly_string += f"{coeff}x^{exponent} + "
-    poly_string = poly_string.replace("+ -", "- ").replace("x^1", "x").replace("x^0","").replace(" 1x", " x").replace(" + 0x", "")[:-3]
-    return poly_string.strip()
-
-
-def random_ints(amount: int, min: int, max: int) -> list[int]:
-    '''returns a list of "amount" length of random integers between ROOT_MIN AND ROOT_MAX'''
+    '''returns product of any number of polynomials
+    \n multiplies pairs in a balanced tree so the big products are few and of similar size'''
+    res = list(factors) or [[1]]
+    while len(res) > 1:
+        res = [poly_mult(res[i], res[i+1]) if i + 1 < len(res) else res[i] for i in range(0, len(res), 2)]
+    return res[0]
+
+
+SUPERSCRIPTS = str.maketrans("0123456789", "⁰¹²³⁴⁵⁶⁷⁸⁹")
+
+
+def power_string(exponent: int, style: str) -> str:
+    '''x raised to `exponent` in the given style'''
+    if exponent == 0:
+        return ""
+    if exponent == 1:
+        return "x"
+    match style:
+        case "plain":
+            return f"x^{exponent}"
+        case "unicode":
+            return "x" + str(exponent).translate(SUPERSCRIPTS)
+        case "latex":
+            return f"x^{{{exponent}}}"
+        case _:
+            raise ValueError(f"unknown style {style!r}")
+
+
+def int_string(n: int) -> str:
+    '''decimal digits of an int, also those longer than python's limit on converting ints to str'''
+    try:
+        return str(n)
+    except ValueError:
+        import decimal  # not limited, only needed for huge coefficients
+        return str(decimal.Decimal(n))
+
+
+def poly_string(polynomial: list[int], style: str = "plain") -> str:
+    '''returns string of a polynomial expression from a list of its coefficients, e.g [c,b,a] -> "ax^2 + bx + c"
+    \n style is "plain", "unicode" (x²) or "latex" (x^{2}), zero terms are left out'''
+    parts = []
+    for exponent in range(len(polynomial) - 1, -1, -1):
+        coeff = polynomial[exponent]
+        if not coeff:
+            continue
+        if parts:
+            parts.append(" - " if coeff < 0 else " + ")
+        elif coeff < 0:
+            parts.append("-")
+        if abs(coeff) != 1 or exponent == 0:
+            parts.append(int_string(abs(coeff)))
+        parts.append(power_string(exponent, style))
+    return "".join(parts) or "0"
+
+
+def random_ints(amount: int, min: int, max: int, rng: Random) -> list[int]:
+    '''returns a list of "amount" length of random integers between min and max'''
     roots = []
     for i in range(amount):
-        roots.append(randint(min, max))
+        roots.append(rng.randint(min, max))
     return roots
 
@@ -0,0 +1,175 @@
+import base64
+from dataclasses import dataclass
+from typing import Any, Self, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from flat_tree import FlatTree
+    from inv_trig import TrigAns
+
+# kinds of questions and what their `spec` holds
+type ComplexSpec = complex  # "complex": the value of the expression
+type RootsSpec = frozenset[int]  # "roots": every root still to be found
+type TrigSpec = tuple[TrigAns, bool]  # "trig": the solutions and wether they are standardised already
+type EquationsSpec = tuple[tuple[FlatTree, FlatTree], ...]  # "equation" and "system": both sides of every equation
+
+
+@dataclass(frozen=True, slots=True)
+class Question:
+    '''a question and the data needed to grade answers to it, holds no functions so it can be pickled'''
+
+    text: str
+    kind: str  # how `spec` is to be interpreted, see above
+    spec: Any
+    fingerprint: int  # 64 bit hash of the question's canonical form, equal for trivially equivalent questions
+
+    def grade(self, answer: str) -> bool:
+        '''returns wether the answer is correct
+        \n raises ValueError if the answer can't be parsed'''
+        # imported here since the generator modules import this module
+        match self.kind:
+            case "complex":
+                from c_arithmetic import parse_complex
+                return parse_complex(answer) == self.spec
+            case "roots":
+                from poly_eq import parse_ints
+                return parse_ints(answer) == self.spec
+            case "trig":
+                from inv_trig import parse_solutions, validate
+                return validate(parse_solutions(answer), *self.spec)
+            case "equation":
+                from eq_system import parse_float
+                return solves(self.spec, (parse_float(answer),))
+            case "system":
+                from eq_system import parse_tuple
+                return solves(self.spec, parse_tuple(answer))
+            case _:
+                raise ValueError(f"unknown kind of question {self.kind!r}")
+
+    def to_json(self) -> dict[str, Any]:
+        '''represent the question with json types only, equations as base64 of `FlatTree.to_bytes`'''
+        match self.kind:
+            case "complex":
+                spec = [self.spec.real, self.spec.imag]
+            case "roots":
+                spec = sorted(self.spec)
+            case "trig":
+                spec = self.spec
+            case "equation" | "system":
+                spec = [[base64.b64encode(side.to_bytes()).decode() for side in eq] for eq in self.spec]
+            case _:
+                raise ValueError(f"unknown kind of question {self.kind!r}")
+        # as hex since json numbers often can't hold 64 bit integers exactly
+        return {"text": self.text, "kind": self.kind, "spec": spec, "fingerprint": f"{self.fingerprint:016x}"}
+
+    @classmethod
+    def from_json(cls, data: dict[str, Any]) -> Self:
+        '''inverse of `to_json`'''
+        spec = data["spec"]
+        match data["kind"]:
+            case "complex":
+                spec = complex(*spec)
+            case "roots":
+                spec = frozenset(spec)
+            case "trig":
+                # nested lists back to the tuples `validate` expects
+                (ans1, ans2), standardised = spec
+                spec = (tuple(tuple(map(tuple, ans)) for ans in (ans1, ans2)), standardised)
+            case "equation" | "system":
+                from flat_tree import FlatTree
+                spec = tuple(tuple(FlatTree.from_bytes(base64.b64decode(side)) for side in eq) for eq in spec)
+            case kind:
+                raise ValueError(f"unknown kind of question {kind!r}")
+        return cls(data["text"], data["kind"], spec, int(data["fingerprint"], 16))
+
+
+def solves(eqs: EquationsSpec, var: tuple[float, ...]) -> bool:
+    '''returns wether var is a solution to every equation, same as calling the OpTreeEqSys
+    \n evaluates the sides compiled, they are cached on the question for its further answers'''
+    for left, right in eqs:
+        try:
+            if left.compile()(var) != right.compile()(var):
+                return False
+        except ZeroDivisionError:
+            return False
+    return True
+
+
+# answers to one equation question from which evaluating them together with numpy is faster
+VECTORIZE_MIN = 64
+
+
+def grade_batch(questions: list[Question], answers: list[str]) -> list[bool | ValueError]:
+    '''grade many answers at once, `answers[i]` answering `questions[i]`
+    \n the result is the grade of every answer, or the error `grade` would have raised for it
+    \n equations are evaluated for all answers to the same question at once with numpy if it's installed'''
+    results: list[bool | ValueError | None] = [None] * len(answers)
+    seen: dict[tuple[int, str], int] = {}  # first index of every (question, answer) pair, repeats are graded once
+    by_question: dict[int, list[int]] = {}  # indices of answers to equation questions, by question
+    for i, (q, answer) in enumerate(zip(questions, answers, strict=True)):
+        if seen.setdefault((id(q), answer), i) != i:
+            continue
+        if q.kind in ("equation", "system"):
+            by_question.setdefault(id(q), []).append(i)
+        else:
+            results[i] = grade_or_error(q, answer)
+
+    try:
+        import numpy as np  # only needed here, slow to import
+    except ImportError:
+        np = None
+    for indices in by_question.values():
+        q = questions[indices[0]]
+        if np is None or len(indices) < VECTORIZE_MIN:
+            for i in indices:
+                results[i] = grade_or_error(q, answers[i])
+        else:
+            for i, result in zip(indices, grade_equations(q, [answers[i] for i in indices])):
+                results[i] = result
+
+    for i, (q, answer) in enumerate(zip(questions, answers)):
+        if results[i] is None:
+            results[i] = results[seen[id(q), answer]]
+    return results
+
+
+def grade_or_error(q: Question, answer: str) -> bool | ValueError:
+    '''`q.grade(answer)` but returning the error instead of raising it'''
+    try:
+        return q.grade(answer)
+    except ValueError as e:
+        return e
+
+
+def grade_equations(q: Question, answers: list[str]) -> list[bool | ValueError]:
+    '''grade many answers to one equation question, evaluating every equation once for all answers'''
+    import numpy as np
+    from eq_system import parse_float, parse_tuple
+
+    results: list[bool | ValueError] = [False] * len(answers)
+    needed = max(side.variables() for eq in q.spec for side in eq)
+    rows, parsed = [], []  # indices of the parsed answers and their first `needed` values
+    for i, answer in enumerate(answers):
+        try:
+            var = (parse_float(answer),) if q.kind == "equation" else parse_tuple(answer)
+        except ValueError as e:
+            results[i] = e
+            continue
+        if len(var) < needed:
+            # wether this is an error depends on the order equations are evaluated in, leave it to `grade`
+            results[i] = grade_or_error(q, answer)
+            continue
+        rows.append(i)
+        parsed.append(var[:needed])
+    if not rows:
+        return results
+
+    var = tuple(np.array(parsed, dtype=float).reshape(len(rows), needed).T)
+    correct = np.ones(len(rows), dtype=bool)
+    with np.errstate(all="ignore"):
+        for left, right in q.spec:
+            l, l_valid = left.evaluate_many(var)
+            r, r_valid = right.evaluate_many(var)
+            correct &= l_valid & r_valid & (l == r)
+    for i, c in zip(rows, correct.tolist()):
+        results[i] = c
+    return results
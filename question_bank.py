@@ -0,0 +1,104 @@
+import os
+import json
+import pickle
+import sqlite3
+import threading
+
+from question import Question
+from question_pool import PoolKey
+
+BANK_PATH = os.path.join(os.path.expanduser("~"), ".cache", "mathlock", "questions.sqlite")
+BANK_VERSION = 3  # bump whenever pickled questions of older versions can't be used anymore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    id INTEGER PRIMARY KEY,
+    type TEXT NOT NULL,
+    difficulty INTEGER,
+    options TEXT NOT NULL,
+    question BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS questions_kind ON questions (type, difficulty, options);
+"""
+
+
+def options_json(key: PoolKey) -> str:
+    '''the options of a pool key as a canonical string'''
+    return json.dumps(key[1])
+
+
+class QuestionBank:
+    '''questions saved on disk by type and options, so generated questions survive a restart
+    \n rows are identified by their id, a pool keeps the ids of its queued questions to remove them once served'''
+
+    def __init__(self, path: str = BANK_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # used from the pool's filler thread as well, access is serialized by `lock`
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.lock = threading.Lock()
+        with self.lock:
+            if self.db.execute("PRAGMA user_version").fetchone()[0] != BANK_VERSION:
+                self.db.execute("DROP TABLE IF EXISTS questions")
+                self.db.execute(f"PRAGMA user_version = {BANK_VERSION}")
+            self.db.executescript(SCHEMA)
+
+    def put(self, key: PoolKey, questions: list[Question]) -> list[int]:
+        '''add questions of the kind `key`, returns their ids'''
+        difficulty = dict(key[1]).get("difficulty")
+        rows = [(key[0], difficulty, options_json(key), pickle.dumps(q)) for q in questions]
+        with self.lock, self.db:
+            return [
+                self.db.execute("INSERT INTO questions (type, difficulty, options, question) VALUES (?, ?, ?, ?)", row).lastrowid
+                for row in rows
+            ]
+
+    def load(self, key: PoolKey, n: int) -> list[tuple[int, Question]]:
+        '''up to `n` questions of the kind `key` with their ids, oldest first
+        \n they stay saved until `remove`d, so they aren't lost if the program is killed before asking them'''
+        difficulty = dict(key[1]).get("difficulty")
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT id, question FROM questions WHERE type = ? AND difficulty IS ? AND options = ? ORDER BY id LIMIT ?",
+                (key[0], difficulty, options_json(key), n)
+            ).fetchall()
+
+        loaded, broken = [], []
+        for i, data in rows:
+            try:
+                loaded.append((i, pickle.loads(data)))
+            except Exception:
+                broken.append(i)  # saved by an incompatible version
+        self.remove(broken)
+        return loaded
+
+    def remove(self, ids: list[int]) -> None:
+        '''delete the questions with these ids, e.g. once they've been asked'''
+        if not ids:
+            return
+        with self.lock, self.db:
+            self.db.executemany("DELETE FROM questions WHERE id = ?", ((i,) for i in ids))
+
+    def count(self, eq_type: str | None = None, difficulty: int | None = None) -> int:
+        '''number of saved questions, optionally only of one type and difficulty'''
+        query, args = "SELECT COUNT(*) FROM questions WHERE 1", []
+        if eq_type is not None:
+            query += " AND type = ?"
+            args.append(eq_type)
+        if difficulty is not None:
+            query += " AND difficulty = ?"
+            args.append(difficulty)
+        with self.lock:
+            return self.db.execute(query, args).fetchone()[0]
+
+    def close(self) -> None:
+        with self.lock:
+            self.db.close()
+
+
+def open_bank(path: str = BANK_PATH) -> QuestionBank | None:
+    '''open the question bank, None if the disk isn't usable'''
+    try:
+        return QuestionBank(path)
+    except (OSError, sqlite3.Error):
+        return None
@@ -0,0 +1,232 @@
+import sys
+import threading
+from collections import deque
+from collections.abc import Callable
+from typing import Any, TYPE_CHECKING
+
+import tracing
+from question import Question
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+    from dedup import BloomFilter
+    from question_bank import QuestionBank
+
+# seconds the filler waits after a failed generation, doubling per failure in a row up to the maximum
+BACKOFF = 0.1
+MAX_BACKOFF = 30.0
+
+# repeats the filler discards in a row before keeping one, by then nearly every possible question has been asked
+DUPLICATE_TRIES = 20
+
+# (equation type, sorted options)
+type PoolKey = tuple[str, tuple[tuple[str, Any], ...]]
+
+
+def pool_key(eq_type: str, options: dict[str, Any]) -> PoolKey:
+    '''key identifying which questions are interchangeable'''
+    return eq_type, tuple(sorted(options.items()))
+
+
+def init_worker() -> None:
+    '''run when a worker process starts, its counters and trace events are sent back with every question by
+    `generate_job` so it mustn't write them on exit itself, it would overwrite the files of the parent process'''
+    import atexit
+    import stats
+    atexit.unregister(stats.dump)
+    atexit.unregister(tracing.write)
+
+
+def generate_job(f: Callable[..., Question], options: dict[str, Any]) -> tuple[Question, Any, Any]:
+    '''generate a question in a worker process, returned with the counters and trace events generating it produced'''
+    import stats
+    q = f(**options)
+    return q, stats.collect(), tracing.collect()
+
+
+def merge_job[T](result: tuple[T, Any, Any]) -> T:
+    '''the result of a job like `generate_job`, the counters and trace events sent with it are added to this process'''
+    import stats  # not needed at startup
+    q, counters, events = result
+    stats.merge(counters)
+    tracing.merge(events)
+    return q
+
+
+class QuestionPool:
+    '''keeps pre-generated questions for every (type, options) combination and tops them up in the background'''
+
+    def __init__(
+        self, eq_types: dict[str, Callable[..., Question]], low: int = 2, high: int = 8,
+        bank: "QuestionBank | None" = None, processes: int = 0, seen: "BloomFilter | None" = None
+    ):
+        '''start refilling a queue once it holds fewer than `low` questions and stop once it holds `high`
+        \n with `bank` queued questions are saved in it as they're generated and removed once returned, so the queues
+        start out with those an earlier run didn't ask, even if it was killed
+        \n with `processes` the filler generates in worker processes so it doesn't compete for the GIL
+        \n with `seen` the filler discards questions whose fingerprint is in it or already queued, and those returned
+        are added to it'''
+        if not 0 <= low <= high or high < 1:
+            raise ValueError("watermarks must satisfy 0 <= low <= high and high >= 1")
+
+        self.eq_types = eq_types
+        self.low = low
+        self.high = high
+        self.queues: dict[PoolKey, deque[Question]] = {}
+        self.rows: dict[PoolKey, deque[int | None]] = {}  # bank ids of the queued questions, None if not saved
+        self.options: dict[PoolKey, dict[str, Any]] = {}
+        self.refilling: set[PoolKey] = set()  # queues below low that haven't reached high yet
+        self.bank = bank
+        self.seen = seen
+        self.duplicates: dict[PoolKey, int] = {}  # repeats the filler discarded in a row, see `DUPLICATE_TRIES`
+
+        self.lock = threading.Condition()  # guards the attributes above, notified when there's work
+        self.active = threading.Event()  # set while the filler is allowed to generate
+        self.stopping = threading.Event()  # set once the filler should end, see `stop`
+        self.thread: threading.Thread | None = None
+        self.processes = processes
+        self.executor: "ProcessPoolExecutor | None" = None
+
+    def register(self, eq_type: str, options: dict[str, Any]) -> PoolKey:
+        '''make sure questions of this kind are kept in the pool'''
+        key = pool_key(eq_type, options)
+        with self.lock:
+            if key not in self.queues:
+                # warm start from questions saved by an earlier run
+                saved = self.bank.load(key, self.high) if self.bank else []
+                self.rows[key] = deque(i for i, _ in saved)
+                self.queues[key] = deque(q for _, q in saved)
+                self.options[key] = dict(options)
+                if len(self.queues[key]) < self.high:
+                    self.refilling.add(key)
+                    self.lock.notify()
+        return key
+
+    def get(self, eq_type: str, options: dict[str, Any]) -> Question:
+        '''pop a pre-generated question, generating one directly only if the pool has run dry
+        \n queued questions in `seen` are skipped, e.g. ones from the bank, a directly generated one is always used'''
+        key = self.register(eq_type, options)
+        served = []  # bank ids of the popped questions
+        with self.lock:
+            queue, rows = self.queues[key], self.rows[key]
+            q = None
+            while queue and q is None:
+                q = queue.popleft()
+                if (i := rows.popleft()) is not None:
+                    served.append(i)
+                if self.seen is not None and q.fingerprint in self.seen:
+                    q = None
+            if len(queue) < self.low:
+                self.refilling.add(key)
+                self.lock.notify()
+        if self.bank is not None:
+            try:
+                self.bank.remove(served)
+            except Exception as e:
+                print(f"question pool: removing asked {eq_type} failed: {e!r}", file=sys.stderr)  # asked again next run
+
+        if q is None:
+            q = self.eq_types[eq_type](**options)
+        if self.seen is not None:
+            with self.lock:
+                self.seen.add(q.fingerprint)
+        return q
+
+    def start(self) -> None:
+        '''start the background filler, it only generates while resumed'''
+        if self.thread is None:
+            if self.processes:
+                self.executor = self._new_executor()
+            self.thread = threading.Thread(target=self._fill, name="QuestionPool", daemon=True)
+            self.thread.start()
+        self.resume()
+
+    def resume(self) -> None:
+        '''allow the filler to generate questions, e.g. while waiting for the next popup'''
+        self.active.set()
+
+    def pause(self) -> None:
+        '''stop generating after the question currently being generated, e.g. while a popup is shown'''
+        self.active.clear()
+
+    def stop(self) -> None:
+        '''end the filler and shut down the worker processes, e.g. before exiting
+        \n a question being generated in this process is left to finish, the filler thread is a daemon'''
+        self.stopping.set()
+        self.active.set()  # wake a paused filler so it sees the stop
+        with self.lock:
+            self.lock.notify_all()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+
+    def _next_key(self) -> PoolKey | None:
+        '''the emptiest queue that needs refilling, if any'''
+        with self.lock:
+            if not self.refilling:
+                return None
+            return min(self.refilling, key=lambda k: len(self.queues[k]))
+
+    def _generate(self, key: PoolKey) -> None:
+        '''add one question to the queue of `key`'''
+        with tracing.span("pool generate", type=key[0]):
+            f, options = self.eq_types[key[0]], self.options[key]
+            q = merge_job(self.executor.submit(generate_job, f, options).result()) if self.executor else f(**options)
+        with self.lock:
+            queue = self.queues[key]
+            repeat = self.seen is not None and (
+                q.fingerprint in self.seen or any(q.fingerprint == p.fingerprint for p in queue)
+            )
+            if repeat:
+                self.duplicates[key] = self.duplicates.get(key, 0) + 1
+                if self.duplicates[key] < DUPLICATE_TRIES:
+                    return  # generate another instead
+            self.duplicates[key] = 0
+
+        # saved right away rather than on exit, which a killed or crashing program never reaches
+        row = None
+        if self.bank is not None:
+            try:
+                row = self.bank.put(key, [q])[0]
+            except Exception as e:
+                print(f"question pool: saving {key[0]} failed: {e!r}", file=sys.stderr)  # still worth asking
+        with self.lock:
+            queue.append(q)
+            self.rows[key].append(row)
+            if len(queue) >= self.high:
+                self.refilling.discard(key)
+
+    def _new_executor(self) -> "ProcessPoolExecutor":
+        '''worker processes to generate in'''
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor  # slow to import, only when needed
+
+        # spawn rather than fork, forking a process with threads and a Tk interpreter isn't safe
+        return ProcessPoolExecutor(self.processes, multiprocessing.get_context("spawn"), initializer=init_worker)
+
+    def _fill(self) -> None:
+        '''filler thread main loop, a failing generator or worker process doesn't end it, only `stop` does'''
+        failures = 0  # in a row
+        while not self.stopping.is_set():
+            self.active.wait()
+            with self.lock:
+                while not self.refilling and not self.stopping.is_set():
+                    self.lock.wait()
+            if self.stopping.is_set() or not self.active.is_set() or (key := self._next_key()) is None:
+                continue
+            try:
+                self._generate(key)
+            except Exception as e:
+                if self.stopping.is_set():
+                    return  # the executor was shut down under it
+                print(f"question pool: generating {key[0]} failed: {e!r}", file=sys.stderr)
+                if self.executor is not None:
+                    from concurrent.futures.process import BrokenProcessPool
+                    if isinstance(e, BrokenProcessPool):  # a worker died, replace them all
+                        self.executor.shutdown(wait=False, cancel_futures=True)
+                        self.executor = self._new_executor()
+                failures += 1
+                self.stopping.wait(min(BACKOFF * 2 ** (failures - 1), MAX_BACKOFF))
+            else:
+                failures = 0
@@ -0,0 +1,88 @@
+import math
+import time
+from collections.abc import Callable
+from typing import TYPE_CHECKING
+
+import tracing
+
+if TYPE_CHECKING:
+    from question_pool import QuestionPool
+
+# when the next question is due
+POLICIES = (
+    "fixed",  # every `period` seconds from the start, missed slots are skipped rather than caught up
+    "after_answer",  # `period` seconds after the last question was answered
+)
+
+
+class Clock:
+    '''wall clock the scheduler waits on'''
+
+    def now(self) -> float:
+        return time.monotonic()
+
+    def sleep_until(self, t: float) -> None:
+        '''block until `now() >= t`'''
+        while (dt := t - self.now()) > 0:
+            time.sleep(dt)
+
+
+class VirtualClock(Clock):
+    '''clock that only moves when told to, so schedules can be run headless and instantly'''
+
+    def __init__(self, start: float = 0.0):
+        self.time = start
+
+    def now(self) -> float:
+        return self.time
+
+    def sleep_until(self, t: float) -> None:
+        self.time = max(self.time, t)
+
+    def advance(self, dt: float) -> None:
+        '''let `dt` seconds pass, e.g. the time the user takes to answer'''
+        self.time += dt
+
+
+class Scheduler:
+    '''asks questions at absolute deadlines, so time spent generating or answering doesn't shift later questions'''
+
+    def __init__(
+        self, period: float, policy: str = "fixed", clock: Clock | None = None, pool: "QuestionPool | None" = None
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {POLICIES}")
+        self.period = period
+        self.policy = policy
+        self.clock = clock or Clock()
+        self.pool = pool  # generates in the background while waiting
+        self.deadlines: list[float] = []  # when every question so far was due
+
+    def next_deadline(self, deadline: float, answered: float) -> float:
+        '''when the question after one due at `deadline` and answered at `answered` is due'''
+        if self.policy == "after_answer":
+            return answered + self.period
+        if self.period <= 0:
+            return answered
+        # first slot of the fixed grid that hasn't passed yet
+        return deadline + max(1, math.ceil((answered - deadline) / self.period)) * self.period
+
+    def run[T](self, prepare: Callable[[int], T], ask: Callable[[T, int], None], count: int | None = None) -> None:
+        '''for every question i: `prepare(i)` while waiting for its deadline, then `ask` the prepared question'''
+        deadline = self.clock.now() + self.period
+        i = 0
+        while count is None or i < count:
+            if self.pool:
+                self.pool.resume()  # generate in the background while waiting
+            with tracing.span("prepare", question=i):
+                prepared = prepare(i)  # overlaps with the wait instead of delaying the popup
+            with tracing.span("sleep", question=i):
+                self.clock.sleep_until(deadline)
+            if self.pool:
+                self.pool.pause()  # leave the cpu to the question
+
+            self.deadlines.append(deadline)
+            with tracing.span("question", question=i, late=self.clock.now() - deadline):
+                ask(prepared, i)
+            deadline = self.next_deadline(deadline, self.clock.now())
+            i += 1
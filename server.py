@@ -0,0 +1,229 @@
+import sys
+import json
+import time
+import asyncio
+import argparse
+import functools
+import itertools
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+
+from main import EQ_TYPES, OPTIONS
+from question import Question
+from question_pool import PoolKey, pool_key, init_worker, generate_job, merge_job
+
+# protocol: one json object per line each way, every request gets exactly one response with the same "id"
+#   {"op": "types"} -> {"types": [...]}
+#   {"op": "question", "type": ..., "options": {...}} -> {"question": <question id>, "text": ..., "kind": ...}
+#   {"op": "grade", "question": <question id>, "answer": ...} -> {"correct": true/false}
+# failures are answered with {"error": ...}
+
+MAX_LINE = 64 * 1024  # longest request accepted
+KEEP_QUESTIONS = 100_000  # questions remembered for grading, the oldest are forgotten first
+MAX_QUEUES = 64  # ready queues kept, the least recently asked for is dropped first
+
+# options clients may set and the range each is clamped to, beyond it one question can take a worker minutes
+OPTION_RANGES = {
+    "difficulty": (1, 8),
+    "degree": (1, 10),
+    "var_count": (1, 10),  # one per variable name
+}
+
+
+def clamp_options(options: Any) -> dict[str, int]:
+    '''check the options a client sent and clamp them to `OPTION_RANGES`
+    \n raises ValueError for anything but known options with integer values'''
+    if not isinstance(options, dict):
+        raise ValueError("options must be an object")
+    clamped = {}
+    for name, value in options.items():
+        if name not in OPTION_RANGES:
+            raise ValueError(f"unknown option {name!r}")
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise ValueError("options must be integers")
+        lo, hi = OPTION_RANGES[name]
+        clamped[name] = min(max(value, lo), hi)
+    return clamped
+
+
+class QuestionServer:
+    '''serves questions to many clients, generating them in worker processes'''
+
+    def __init__(self, workers: int | None = None, low: int = 2, high: int = 8):
+        self.executor = ProcessPoolExecutor(workers, initializer=init_worker)
+        self.low = low  # refill a ready queue when it has fewer questions than this
+        self.high = high  # up to this many
+        self.ready: OrderedDict[PoolKey, deque[Question]] = OrderedDict()  # least recently asked for first
+        self.refilling: set[PoolKey] = set()
+        self.tasks: set[asyncio.Task] = set()  # running refills, referenced so they aren't garbage collected
+        self.questions: OrderedDict[int, Question] = OrderedDict()  # asked questions by id, for grading
+        self.ids = itertools.count()
+
+    async def generate(self, key: PoolKey) -> Question:
+        '''generate a question in a worker process'''
+        f = functools.partial(generate_job, EQ_TYPES[key[0]], dict(key[1]))
+        return merge_job(await asyncio.get_running_loop().run_in_executor(self.executor, f))
+
+    async def refill(self, key: PoolKey, queue: deque[Question]) -> None:
+        '''top up `queue`, the ready queue of `key`, to the high watermark
+        \n the queue is passed in since the task starts later, when the key may have been dropped already'''
+        try:
+            while len(queue) < self.high and self.ready.get(key) is queue:  # stop once it's dropped
+                queue.append(await self.generate(key))
+        finally:
+            self.refilling.discard(key)
+
+    def refilled(self, task: asyncio.Task) -> None:
+        '''done callback of refill tasks, reports failures that no client is waiting for'''
+        self.tasks.discard(task)
+        if not task.cancelled() and (e := task.exception()) is not None:
+            print(f"refilling failed: {e!r}", file=sys.stderr)
+
+    async def question(self, eq_type: str, options: dict[str, Any]) -> Question:
+        '''a ready question if there is one, otherwise a freshly generated one'''
+        if not isinstance(eq_type, str) or eq_type not in EQ_TYPES:
+            raise ValueError(f"unknown type {eq_type!r}")
+        key = pool_key(eq_type, OPTIONS | clamp_options(options))
+        if key in self.ready:
+            self.ready.move_to_end(key)
+        else:
+            self.ready[key] = deque()
+            if len(self.ready) > MAX_QUEUES:
+                self.ready.popitem(last=False)
+        queue = self.ready[key]
+        q = queue.popleft() if queue else None
+        if len(queue) < self.low and key not in self.refilling:
+            self.refilling.add(key)
+            task = asyncio.create_task(self.refill(key, queue))
+            self.tasks.add(task)
+            task.add_done_callback(self.refilled)
+        return q or await self.generate(key)
+
+    def remember(self, q: Question) -> int:
+        '''store an asked question so answers to it can be graded, returns its id'''
+        i = next(self.ids)
+        self.questions[i] = q
+        if len(self.questions) > KEEP_QUESTIONS:
+            self.questions.popitem(last=False)
+        return i
+
+    async def respond(self, request: dict[str, Any]) -> dict[str, Any]:
+        '''the response to one request'''
+        match request.get("op"):
+            case "types":
+                return {"types": list(EQ_TYPES)}
+            case "question":
+                q = await self.question(request.get("type"), request.get("options", {}))
+                return {"question": self.remember(q), "text": q.text, "kind": q.kind}
+            case "grade":
+                q = self.questions.get(request.get("question"))
+                if q is None:
+                    raise ValueError("unknown question")
+                return {"correct": q.grade(str(request.get("answer", "")))}
+            case op:
+                raise ValueError(f"unknown op {op!r}")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        '''serve one client connection'''
+        try:
+            while line := await reader.readline():
+                request = {}
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        request = {}
+                        raise ValueError("request must be an object")
+                    response = await self.respond(request)
+                except Exception as e:  # includes invalid json, a failure answers this request but keeps the connection
+                    response = {"error": str(e) or type(e).__name__}
+                if "id" in request:
+                    response["id"] = request["id"]
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, ValueError):  # disconnected or sent a line longer than MAX_LINE
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765, unix: str | None = None) -> None:
+        '''accept clients forever'''
+        if unix:
+            server = await asyncio.start_unix_server(self.handle, unix, limit=MAX_LINE)
+        else:
+            server = await asyncio.start_server(self.handle, host, port, limit=MAX_LINE)
+        print(f"serving on {unix or f'{host}:{port}'}", file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+
+async def connect(host: str = "127.0.0.1", port: int = 8765, unix: str | None = None):
+    '''open a connection to a question server'''
+    if unix:
+        return await asyncio.open_unix_connection(unix, limit=MAX_LINE)
+    return await asyncio.open_connection(host, port, limit=MAX_LINE)
+
+
+async def request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, **message: Any) -> dict[str, Any]:
+    '''send one request and wait for its response'''
+    writer.write(json.dumps(message).encode() + b"\n")
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+
+async def load_test(clients: int, requests: int, eq_type: str | None, options: dict[str, Any], **address) -> list[float]:
+    '''`clients` concurrent clients each asking for and answering `requests` questions, returns every round trip time'''
+    times = []
+
+    async def client(c: int) -> None:
+        reader, writer = await connect(**address)
+        types = (await request(reader, writer, op="types"))["types"]
+        for i in range(requests):
+            start = time.perf_counter()
+            q = await request(reader, writer, op="question", type=eq_type or types[(c + i) % len(types)], options=options)
+            if "error" in q:
+                raise RuntimeError(q["error"])
+            await request(reader, writer, op="grade", question=q["question"], answer="0")
+            times.append(time.perf_counter() - start)
+        writer.close()
+
+    await asyncio.gather(*(client(c) for c in range(clients)))
+    return times
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="serve questions to MathLock clients over json lines")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help in (("serve", "run the server"), ("load", "load test a running server")):
+        p = sub.add_parser(name, help=help)
+        p.add_argument("--host", default="127.0.0.1")
+        p.add_argument("--port", type=int, default=8765)
+        p.add_argument("--unix", help="unix socket path, instead of tcp")
+        if name == "serve":
+            p.add_argument("--workers", type=int, help="generator processes, defaults to the number of cpus")
+        else:
+            p.add_argument("--clients", type=int, default=50)
+            p.add_argument("--requests", type=int, default=20, help="questions per client")
+            p.add_argument("--type", choices=tuple(EQ_TYPES), help="only ask this type, default all in turn")
+            p.add_argument("--difficulty", type=int, default=OPTIONS["difficulty"])
+
+    args = parser.parse_args()
+    address = {"host": args.host, "port": args.port, "unix": args.unix}
+    match args.command:
+        case "serve":
+            asyncio.run(QuestionServer(args.workers).serve(**address))
+        case "load":
+            from benchmark import summarize
+
+            start = time.perf_counter()
+            times = asyncio.run(load_test(args.clients, args.requests, args.type, {"difficulty": args.difficulty}, **address))
+            elapsed = time.perf_counter() - start
+            stats = summarize(times)
+            print(
+                f"{len(times)} questions in {elapsed:.2f} s, {len(times) / elapsed:.1f}/s, "
+                f"p50 {stats['p50']*1e3:.1f} ms  p95 {stats['p95']*1e3:.1f} ms  p99 {stats['p99']*1e3:.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
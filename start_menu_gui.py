@@ -1,6 +1,8 @@
 import tkinter as tk
 from tkinter import ttk
 
+from gui import get_root, center_geometry
+
 class Checkboxes(ttk.Frame):
    def __init__(self, parent=None, options=[], side=tk.BOTTOM, anchor=tk.W):
       ttk.Frame.__init__(self, parent)
@@ -36,17 +38,16 @@ class Slider(ttk.Frame):
    
 def start_menu(eq_types: tuple[str]) -> dict[str]:
     exit = False
-    win = tk.Tk()  # new window
+    win = tk.Toplevel(get_root())  # new window on the root the questions use as well
     win.title("MathLock Settings")  # rename window
-    win_width = 500  # window width
-    win_height = 500  # window height
-    screen_width = win.winfo_screenwidth()
-    screen_height = win.winfo_screenheight()
-    x_cord = (screen_width - win_width) // 2  # horizontal offset
-    y_cord = (screen_height - win_height) // 2  # vertical offset
-    win.geometry(f"{win_width}x{win_height}+{x_cord}+{y_cord}")  # resize and reposition
+    win.geometry(center_geometry(win, 500, 500))  # resize and reposition
     win.resizable(False, False) # disable resizing
 
+    def close():
+        win.destroy()
+        win.quit()  # return from mainloop
+    win.protocol("WM_DELETE_WINDOW", close)
+
     
     # create widgets
     eq_options = ttk.Frame(win)
@@ -61,7 +62,7 @@ def start_menu(eq_types: tuple[str]) -> dict[str]:
     sleep_text = ttk.Label(sleep, text="Sleep Time")
     sleep_slider = Slider(sleep, max=256, min=0)
 
-    start = ttk.Button(win, text="Start", command = win.destroy)
+    start = ttk.Button(win, text="Start", command = close)
 
     #set grid row and column size
     for col in range(4):
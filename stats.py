@@ -0,0 +1,148 @@
+import os
+import sys
+import json
+import time
+import atexit
+import inspect
+import functools
+import threading
+from collections import Counter, defaultdict
+from collections.abc import Callable
+from typing import Any
+
+# (generator, difficulty), None for work done outside any measured call
+type StatsKey = tuple[str, int | None] | None
+
+# every thread's counters, merged when queried so counting never takes a lock
+_all_counters: list[defaultdict[StatsKey, Counter[str]]] = []
+_all_lock = threading.Lock()
+
+
+class _Local(threading.local):
+    '''counters of the current thread'''
+
+    def __init__(self):
+        self.counters: defaultdict[StatsKey, Counter[str]] = defaultdict(Counter)
+        self.current = self.counters[None]  # counters of the innermost measured call
+        with _all_lock:
+            _all_counters.append(self.counters)
+
+
+_local = _Local()
+
+
+def count(event: str, n: float = 1) -> None:
+    '''add `n` to a counter of the generator call currently running in this thread'''
+    _local.current[event] += n
+
+
+def measured(name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    '''count calls and wall time of a generator per difficulty, events counted during a call are attributed to it'''
+    def decorator(f: Callable[..., Any]) -> Callable[..., Any]:
+        params = tuple(inspect.signature(f).parameters)
+        position = params.index("difficulty") if "difficulty" in params else None
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            difficulty = kwargs.get("difficulty")
+            if position is not None and position < len(args):
+                difficulty = args[position]
+            local = _local
+            outer = local.current
+            local.current = current = local.counters[name, difficulty]
+            start = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                local.current = outer
+                current["calls"] += 1
+                current["seconds"] += elapsed
+                if elapsed > current["max seconds"]:
+                    current["max seconds"] = elapsed
+        return wrapper
+    return decorator
+
+
+def snapshot() -> dict[StatsKey, dict[str, float]]:
+    '''counters of all threads added together'''
+    merged: defaultdict[StatsKey, Counter[str]] = defaultdict(Counter)
+    with _all_lock:
+        for counters in _all_counters:
+            for key, c in list(counters.items()):
+                for event, n in list(c.items()):
+                    if event == "max seconds":
+                        merged[key][event] = max(merged[key][event], n)
+                    else:
+                        merged[key][event] += n
+    return {key: dict(c) for key, c in merged.items() if c}
+
+
+def collect() -> dict[StatsKey, dict[str, float]]:
+    '''counters since the last `collect` or `reset`, e.g. to send them from a worker process
+    \n events counted by other threads meanwhile are lost, fine for a worker generating in a single thread'''
+    stats = snapshot()
+    reset()
+    return stats
+
+
+def merge(stats: dict[StatsKey, dict[str, float]]) -> None:
+    '''add counters collected elsewhere, e.g. in a worker process, to those of the current thread'''
+    counters = _local.counters
+    for key, c in stats.items():
+        for event, n in c.items():
+            if event == "max seconds":
+                counters[key][event] = max(counters[key][event], n)
+            else:
+                counters[key][event] += n
+
+
+def reset() -> None:
+    '''zero every counter'''
+    with _all_lock:
+        for counters in _all_counters:
+            for c in counters.values():
+                c.clear()
+
+
+def report() -> str:
+    '''human readable table of the counters, slowest generators first'''
+    lines = []
+    stats = snapshot()
+    for key in sorted(stats, key=lambda k: -stats[k].get("seconds", 0)):
+        c = stats[key]
+        name = "other" if key is None else f"{key[0]} (difficulty {key[1]})"
+        lines.append(name)
+        if "calls" in c:
+            lines.append(
+                f"\t{c['calls']:.0f} calls, {c['seconds'] / c['calls'] * 1e3:.3f} ms mean, "
+                f"{c['max seconds'] * 1e3:.3f} ms max"
+            )
+        for event, n in sorted(c.items()):
+            if event not in ("calls", "seconds", "max seconds"):
+                per_call = f" ({n / c['calls']:.2f} per call)" if "calls" in c else ""
+                lines.append(f"\t{event}: {n:.0f}{per_call}")
+    return "\n".join(lines)
+
+
+def dump(path: str = "-") -> None:
+    '''write the counters as json to `path`, or the report to stderr for "-"'''
+    if path == "-":
+        print(report(), file=sys.stderr)
+        return
+    stats = [
+        {"generator": key and key[0], "difficulty": key and key[1]} | c
+        for key, c in snapshot().items()
+    ]
+    with open(path, "w") as f:
+        json.dump(stats, f, indent=1)
+
+
+def dump_at_exit(path: str = "-") -> None:
+    '''dump the counters when the interpreter exits'''
+    atexit.register(dump, path)
+
+
+# e.g. MATHLOCK_STATS=- python main.py to print the counters on exit
+if (_path := os.environ.get("MATHLOCK_STATS")):
+    dump_at_exit(_path)
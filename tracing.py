@@ -0,0 +1,86 @@
+import os
+import json
+import time
+import atexit
+import threading
+import contextlib
+from collections.abc import Iterator
+from typing import Any
+
+# chrome trace events, see https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU
+events: list[dict[str, Any]] = []
+enabled = False  # nothing is recorded unless tracing was started
+
+_pid = os.getpid()
+_named_threads: set[int] = set()
+
+
+def now() -> float:
+    '''current time in trace units, microseconds'''
+    return time.perf_counter_ns() / 1e3
+
+
+def _thread() -> int:
+    '''id of the current thread, naming it in the trace the first time'''
+    tid = threading.get_ident()
+    if tid not in _named_threads:
+        _named_threads.add(tid)
+        events.append({
+            "name": "thread_name", "ph": "M", "pid": _pid, "tid": tid,
+            "args": {"name": threading.current_thread().name},
+        })
+    return tid
+
+
+def complete(name: str, start: float, **args: Any) -> None:
+    '''record a span from `start`, as returned by `now`, until now'''
+    if enabled:
+        end = now()
+        events.append({"name": name, "ph": "X", "ts": start, "dur": end - start, "pid": _pid, "tid": _thread(), "args": args})
+
+
+@contextlib.contextmanager
+def _span(name: str, args: dict[str, Any]) -> Iterator[None]:
+    start = now()
+    try:
+        yield
+    finally:
+        complete(name, start, **args)
+
+
+def span(name: str, **args: Any) -> contextlib.AbstractContextManager[None]:
+    '''record the duration of a with block'''
+    return _span(name, args) if enabled else contextlib.nullcontext()
+
+
+def collect() -> list[dict[str, Any]]:
+    '''remove and return the events recorded so far, e.g. to send them from a worker process
+    \n they keep the worker's pid, so the worker shows up as its own process in the merged trace'''
+    collected = events[:]
+    del events[:len(collected)]
+    return collected
+
+
+def merge(collected: list[dict[str, Any]]) -> None:
+    '''add events collected elsewhere, e.g. in a worker process'''
+    if enabled:
+        events.extend(collected)
+
+
+def write(path: str) -> None:
+    '''save the recorded events as a chrome trace, viewable in perfetto or chrome://tracing'''
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def start(path: str) -> None:
+    '''start recording and save the trace to `path` when the interpreter exits'''
+    global enabled
+    if not enabled:
+        enabled = True
+        atexit.register(write, path)
+
+
+# e.g. MATHLOCK_TRACE=trace.json python main.py
+if (_path := os.environ.get("MATHLOCK_TRACE")):
+    start(_path)